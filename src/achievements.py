@@ -0,0 +1,125 @@
+import os
+import json
+import asyncio
+import logging as log
+
+from executors import run_in, FILESYSTEM
+
+
+def merge_unlocks(characters):
+    """Reduces unlocks of many characters to the earliest unlock time of every achievement
+    :param characters   iterable of dicts achievement_id: unlock_time, one per character
+    :returns            dict achievement_id: earliest unlock_time
+    """
+    earliest = {}
+    get = earliest.get
+    for unlocks in characters:
+        for achievement_id, unlock_time in unlocks.items():
+            previous = get(achievement_id)
+            if previous is None or unlock_time < previous:
+                earliest[achievement_id] = unlock_time
+    return earliest
+
+
+class AchievementsStore(object):
+    """Append-only on-disk log of known achievement unlocks, kept per game and per character.
+
+    Every line of the log is a JSON record ``[game, character, {achievement_id: unlock_time}]``
+    holding the unlocks that were new at the time of writing. Loading replays the log, so a record
+    never has to be rewritten in place. When the log grows well past the amount of live data it is
+    compacted into a temporary file and atomically swapped in.
+    """
+    COMPACTION_RATIO = 4
+
+    def __init__(self, path):
+        self.path = path
+        self._unlocks = {}  # game -> character -> {achievement_id: unlock_time}
+        self._records = 0
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    async def load(self):
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            self._unlocks, self._records = await run_in(FILESYSTEM, self._read)
+            self._loaded = True
+
+    def characters(self, game):
+        return self._unlocks.get(game, {})
+
+    def unlocks(self, game, character):
+        return self._unlocks.get(game, {}).get(character, {})
+
+    async def merge(self, game, character, unlocks):
+        """Merges fetched unlocks into the store and persists only the ones not known before
+        :param unlocks  dict of achievement_id: unlock_time
+        :returns        dict of newly stored or improved (earlier) unlocks
+        """
+        await self.load()
+        known = self._unlocks.setdefault(game, {}).setdefault(character, {})
+        delta = {}
+        for achievement_id, unlock_time in unlocks.items():
+            previous = known.get(achievement_id)
+            if previous is None or unlock_time < previous:
+                delta[achievement_id] = unlock_time
+        if not delta:
+            return delta
+
+        known.update(delta)
+        async with self._lock:
+            await run_in(FILESYSTEM, self._append, [game, character, delta])
+            self._records += 1
+            if self._records > self.COMPACTION_RATIO * max(1, self._characters_count()):
+                await run_in(FILESYSTEM, self._compact, self._snapshot())
+                self._records = self._characters_count()
+        return delta
+
+    def _characters_count(self):
+        return sum(len(characters) for characters in self._unlocks.values())
+
+    def _snapshot(self):
+        return [
+            [game, character, dict(unlocks)]
+            for game, characters in self._unlocks.items()
+            for character, unlocks in characters.items()
+        ]
+
+    def _read(self):
+        unlocks = {}
+        records = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        game, character, delta = json.loads(line)
+                    except ValueError:
+                        log.warning(f'Skipping corrupted achievements record in {self.path}')
+                        continue
+                    known = unlocks.setdefault(game, {}).setdefault(character, {})
+                    for achievement_id, unlock_time in delta.items():
+                        achievement_id = int(achievement_id)
+                        previous = known.get(achievement_id)
+                        if previous is None or unlock_time < previous:
+                            known[achievement_id] = unlock_time
+                    records += 1
+        except FileNotFoundError:
+            pass
+        return unlocks, records
+
+    def _append(self, record):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _compact(self, records):
+        log.debug(f'Compacting achievements store {self.path}')
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
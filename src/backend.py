@@ -1,54 +1,261 @@
 import asyncio
 import requests
-import functools
+import threading
 import logging as log
+from time import time
 
 from http import HTTPStatus
+from urllib.parse import urlparse
 
 from galaxy.api.errors import BackendTimeout, BackendError, AccessDenied, \
     AuthenticationRequired, BackendNotAvailable, UnknownError
 
 from consts import FIREFOX_AGENT
+from executors import run_in, NETWORK
+from resilience import CircuitBreaker, RetryBudget, backoff_delay, current_deadline
 
 
 class AccessTokenExpired(Exception):
     pass
 
 
+class RequestCancelled(Exception):
+    pass
+
+
+class _CancellableRequest(object):
+    """Blocking session.request run in an executor thread that can be aborted from the event loop.
+    The body is streamed in chunks so that a cancelled or overdue request stops reading and closes its socket
+    instead of keeping the thread busy until the transfer ends.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, session, params, expires_at=None):
+        self._session = session
+        self._params = params
+        self._expires_at = expires_at
+        self._cancelled = threading.Event()
+        self._response = None
+
+    def run(self):
+        if self._cancelled.is_set():
+            raise RequestCancelled()
+        response = self._session.request(stream=True, **self._params)
+        self._response = response
+        try:
+            chunks = []
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                if self._cancelled.is_set():
+                    raise RequestCancelled()
+                if self._expires_at is not None and time() > self._expires_at:
+                    raise requests.Timeout()
+                chunks.append(chunk)
+            response._content = b''.join(chunks)
+        except BaseException:
+            response.close()
+            raise
+        return response
+
+    def cancel(self):
+        self._cancelled.set()
+        if self._response is not None:
+            self._response.close()
+
+
 class BackendClient(object):
-    def __init__(self, plugin, authentication_client):
+    TRANSIENT_ERRORS = (BackendTimeout, BackendNotAvailable, BackendError, requests.ConnectionError)
+    OFFLINE_ERRORS = (BackendTimeout, BackendNotAvailable, requests.ConnectionError)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD')
+    MAX_RETRIES = 2
+    SC2_REGION_IDS = {'us': 1, 'eu': 2, 'kr': 3}
+    # how long a stale cached response may still be served while it is revalidated
+    VOLATILE_STALE_WINDOW = 5 * 60  # owned games, characters, achievement progress
+    ACCOUNT_STALE_WINDOW = 3600  # battletag, list of SC2 profiles
+
+    def __init__(self, plugin, authentication_client, response_cache=None):
         self._plugin = plugin
         self._authentication_client = authentication_client
+        self._response_cache = response_cache
+        self._revalidations = {}
+        # (realm, character name) -> (lastModified from the characters list, Last-Modified response header)
+        self._wow_character_markers = {}
+        self._auth_lock = asyncio.Lock()
+        self._auth_generation = 0
+        self._breakers = {}
+        self._retry_budgets = {}
 
     async def _authenticated_request(self, method, url, data=None, json=True, headers=None, ignore_failure=False):
+        await self.ensure_fresh_auth()
+        generation = self._auth_generation
         try:
             return await self.do_request(method, url, data, json, headers, ignore_failure)
-        except:
+        except AuthenticationRequired:
+            await self._refresh_auth(generation)
+            return await self.do_request(method, url, data, json, headers, ignore_failure)
+
+    def _cache_account(self):
+        user_details = self._authentication_client.user_details
+        return user_details.get("id") if user_details else None
+
+    async def _cached_get(self, url, stale_window):
+        """GET of a JSON document through the response cache. A fresh entry is returned without a request,
+        a stale one is returned at once while it is revalidated in the background, and the last good one is
+        returned when the backend cannot be reached.
+        :param stale_window    seconds a stale entry may be served unless Cache-Control says otherwise
+        """
+        account = self._cache_account()
+        secret = self._authentication_client.cache_key
+        if self._response_cache is None or account is None or secret is None:
+            return await self._authenticated_request("GET", url)
+
+        cached = await self._response_cache.get(account, url, secret)
+        now = time()
+        if cached is not None and now < cached.fresh_until:
+            return cached.body
+        if cached is not None and now < cached.stale_until:
+            self._revalidate_in_background(url, account, secret, cached, stale_window)
+            return cached.body
+        try:
+            return await self._fetch_into_cache(url, account, secret, cached, stale_window)
+        except self.OFFLINE_ERRORS:
+            if cached is None:
+                raise
+            log.warning(f"Backend unreachable, serving response of {url} cached {now - cached.stored_at:.0f}s ago")
+            return cached.body
+
+    async def _fetch_into_cache(self, url, account, secret, cached, stale_window):
+        headers = dict(self._authentication_client.session.headers)
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        response = await self._authenticated_request("GET", url, json=False, headers=headers)
+        cache_control = response.headers.get("Cache-Control")
+        if response.status_code == HTTPStatus.NOT_MODIFIED and cached is not None:
+            await self._response_cache.touch(account, url, cache_control, stale_window)
+            return cached.body
+        body = response.json()
+        await self._response_cache.put(
+            account, url, secret, body, response.headers.get("ETag"), cache_control, stale_window
+        )
+        return body
+
+    def _revalidate_in_background(self, url, account, secret, cached, stale_window):
+        if url in self._revalidations:
+            return
+
+        async def revalidate():
+            try:
+                await self._fetch_into_cache(url, account, secret, cached, stale_window)
+            except Exception as e:
+                log.warning(f"Revalidating cached response of {url} failed: {repr(e)}")
+
+        task = asyncio.create_task(revalidate())
+        self._revalidations[url] = task
+        task.add_done_callback(lambda _: self._revalidations.pop(url, None))
+
+    async def clear_cached_responses(self, account):
+        if self._response_cache is not None:
+            await self._response_cache.clear(account)
+
+    def cancel_revalidations(self):
+        for task in list(self._revalidations.values()):
+            task.cancel()
+
+    async def ensure_fresh_auth(self):
+        lifecycle = self._authentication_client.auth_lifecycle
+        if lifecycle.token_expired():
+            # as before expiry tracking, the cookie session and stored user details stay in use;
+            # authentication is lost only if the session cannot be refreshed
+            log.info("Access token expired, refreshing session cookies")
+            await self._refresh_auth(self._auth_generation)
+            lifecycle.forget_token()
+        elif lifecycle.needs_refresh():
+            log.info("Session cookies are about to expire, refreshing")
+            await self._refresh_auth(self._auth_generation)
+
+    async def _refresh_auth(self, generation):
+        """Refreshes session cookies and stored credentials once for all requests that failed concurrently.
+        Transient errors are raised as they are and leave the refresh due, so it is retried by a later call;
+        authentication is lost only when the backend rejects the session.
+        :param generation   value of _auth_generation seen by the caller before it decided to refresh
+        """
+        async with self._auth_lock:
+            if generation != self._auth_generation:
+                return
             try:
                 await self.refresh_cookies()
                 self._authentication_client.refresh_credentials()
-
-            except Exception:
+            except self.TRANSIENT_ERRORS as e:
+                log.warning(f"Refreshing session cookies failed, will retry: {repr(e)}")
+                raise
+            except (AuthenticationRequired, AccessDenied, UnknownError):
                 self._plugin.lost_authentication()
                 raise AccessDenied()
-            return await self.do_request(method, url, data, json, headers, ignore_failure)
+            self._auth_generation += 1
 
     async def do_request(self, method, url, data=None, json=True, headers=None, ignore_failure=False):
-        loop = asyncio.get_event_loop()
+        host = urlparse(url).hostname
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+            self._retry_budgets[host] = RetryBudget()
+        budget = self._retry_budgets[host]
+        budget.deposit()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                log.warning(f"Circuit for {host} is open, not sending {method} {url}")
+                raise BackendNotAvailable()
+            try:
+                result = await self._send(method, url, data, json, headers, ignore_failure)
+            except self.TRANSIENT_ERRORS:
+                breaker.record_failure()
+                if method not in self.IDEMPOTENT_METHODS or attempt >= self.MAX_RETRIES or not budget.withdraw():
+                    raise
+                delay = backoff_delay(attempt)
+                deadline = current_deadline()
+                if deadline is not None and deadline.remaining() <= delay:
+                    raise
+                log.info(f"Retrying {method} {url} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            except Exception:
+                breaker.record_success()  # host responded, the failure is not an outage
+                raise
+            else:
+                breaker.record_success()
+                return result
+
+    async def _send(self, method, url, data, json, headers, ignore_failure):
         if not headers:
             headers = self._authentication_client.session.headers
         try:
             if data is None:
                 data = {}
+            timeout = self._authentication_client.timeout
+            deadline = current_deadline()
+            if deadline is not None:
+                if deadline.expired():
+                    raise BackendTimeout()
+                timeout = min(timeout, deadline.remaining())
             params = {
                 "method": method,
                 "url": url,
                 "data": data,
-                "timeout": self._authentication_client.timeout,
+                "timeout": timeout,
                 "headers": headers
             }
+            request = _CancellableRequest(
+                self._authentication_client.session, params, deadline.expires_at if deadline else None
+            )
             try:
-                response = await loop.run_in_executor(None, functools.partial(self._authentication_client.session.request, **params))
+                response = await run_in(NETWORK, request.run)
+            except asyncio.CancelledError:
+                request.cancel()
+                raise
             except requests.Timeout:
                 raise BackendTimeout()
 
@@ -94,6 +301,7 @@ class BackendClient(object):
         log.debug(f"---GET https://{self._authentication_client.region}.account.blizzard.com/api/games-and-subs, {r.status_code}, {r.url}, {r.headers}\n\n{r.content}\n--------------------")
 
         if r.status_code != 401:
+            self._authentication_client.auth_lifecycle.refreshed(self._authentication_client.session.cookies)
             return
 
         headers = {
@@ -110,11 +318,11 @@ class BackendClient(object):
         r = await self.do_request("GET", f"https://{self._authentication_client.region}.account.blizzard.com/api/games-and-subs", json=False,
                                    headers=headers)
         log.debug(f"--GET https://{self._authentication_client.region}.account.blizzard.com/api/games-and-subs, {r.status_code}, {r.url}, {r.headers}\n\n{r.content}\n--------------------")
-        return
+        self._authentication_client.auth_lifecycle.refreshed(self._authentication_client.session.cookies)
 
     async def get_user_info(self):
         url = f"https://{self._authentication_client.region}.battle.net/oauth/userinfo"
-        return await self._authenticated_request("GET", url)
+        return await self._cached_get(url, self.ACCOUNT_STALE_WINDOW)
 
     async def get_account_details(self):
         details_url = f"https://{self._authentication_client.region}.account.blizzard.com/api/details"
@@ -122,26 +330,66 @@ class BackendClient(object):
 
     async def get_owned_games(self):
         games_url = f"https://{self._authentication_client.region}.account.blizzard.com/api/games-and-subs"
-        return await self._authenticated_request("GET", games_url)
+        return await self._cached_get(games_url, self.VOLATILE_STALE_WINDOW)
 
     async def validate_access_token(self, access_token):
         # this is inconsistent with the documentation https://develop.battle.net/documentation/api-reference/oauth-api
         token_url = f"https://{self._authentication_client.region}.battle.net/oauth/check_token"
         # return await self.do_request()("POST", token_url, data={"token": access_token})
-        return await self.do_request("POST", token_url, data={"token": access_token}, ignore_failure=True)
+        auth_status = await self.do_request("POST", token_url, data={"token": access_token}, ignore_failure=True)
+        self._authentication_client.auth_lifecycle.update_token(auth_status)
+        return auth_status
 
     async def get_sc2_player_data(self, account_id):
         url = f"https://{self._authentication_client.region}.api.blizzard.com/sc2/player/{account_id}"
-        return await self._authenticated_request("GET", url)
+        return await self._cached_get(url, self.ACCOUNT_STALE_WINDOW)
 
     async def get_sc2_profile_data(self, region_id, realm_id, player_id):
         url = f"https://{self._authentication_client.region}.api.blizzard.com/sc2/profile/{region_id}/{realm_id}/{player_id}"
-        return await self._authenticated_request("GET", url)
+        return await self._cached_get(url, self.VOLATILE_STALE_WINDOW)
 
     async def get_wow_character_data(self):
         url = f"https://{self._authentication_client.region}.api.blizzard.com/wow/user/characters"
-        return await self._authenticated_request("GET", url)
+        return await self._cached_get(url, self.VOLATILE_STALE_WINDOW)
+
+    async def get_wow_character_achievements(self, realm, character_name, last_modified=None):
+        """Fetches achievements of a character unless it is known to be unchanged since the previous fetch
+        :param last_modified    character's lastModified marker taken from get_wow_character_data
+        :returns                achievements document or None if the character has not changed
+        """
+        key = (realm.lower(), character_name)
+        marker, validator = self._wow_character_markers.get(key, (None, None))
+        if last_modified is not None and marker == last_modified:
+            log.debug(f"Skipping achievements of unchanged character {character_name}-{realm}")
+            return None
 
-    async def get_wow_character_achievements(self,  realm, character_name):
         url = f"https://{self._authentication_client.region}.api.blizzard.com/wow/character/{realm.lower()}/{character_name}?fields=achievements"
-        return await self.do_request("GET", url)
+        headers = dict(self._authentication_client.session.headers)
+        if validator:
+            headers["If-Modified-Since"] = validator
+        response = await self.do_request("GET", url, json=False, headers=headers)
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            self._wow_character_markers[key] = (last_modified, validator)
+            return None
+        self._wow_character_markers[key] = (last_modified, response.headers.get("Last-Modified"))
+        return response.json()
+
+    async def _get_metadata_document(self, url, etag):
+        headers = dict(self._authentication_client.session.headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        response = await self._authenticated_request("GET", url, json=False, headers=headers)
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return None, etag
+        return response.json(), response.headers.get("ETag")
+
+    async def get_wow_achievements_metadata(self, locale, etag=None):
+        """:returns    (definitions of all WoW achievements or None if not modified since etag, ETag)"""
+        url = f"https://{self._authentication_client.region}.api.blizzard.com/wow/data/character/achievements?locale={locale}"
+        return await self._get_metadata_document(url, etag)
+
+    async def get_sc2_achievements_metadata(self, locale, etag=None):
+        """:returns    (definitions of all SC2 achievements or None if not modified since etag, ETag)"""
+        region_id = self.SC2_REGION_IDS.get(self._authentication_client.region, 1)
+        url = f"https://{self._authentication_client.region}.api.blizzard.com/sc2/static/profile/{region_id}?locale={locale}"
+        return await self._get_metadata_document(url, etag)
@@ -1,6 +1,7 @@
 import sys
 from enum import Enum
 import os
+import getpass
 
 
 class Platform(Enum):
@@ -13,13 +14,32 @@ if sys.platform == 'win32':
     SYSTEM = Platform.WINDOWS
 elif sys.platform == 'darwin':
     SYSTEM = Platform.MACOS
+elif sys.platform.startswith('linux'):
+    SYSTEM = Platform.LINUX
 
 if SYSTEM == Platform.WINDOWS:
     AGENT_PATH = os.path.expandvars(r'%ALLUSERSPROFILE%\Battle.net\Agent')
     CONFIG_PATH = os.path.expandvars(r'%APPDATA%\Battle.net\Battle.net.config')    
+    PLUGIN_DATA_PATH = os.path.expandvars(r'%LOCALAPPDATA%\GOG.com\Galaxy\plugins\data\battlenet')
 elif SYSTEM == Platform.MACOS:
     AGENT_PATH = '/Users/Shared/Battle.net/Agent'
     CONFIG_PATH = os.path.expanduser('~/Library/Application Support/Battle.net/Battle.net.config')
+    PLUGIN_DATA_PATH = os.path.expanduser('~/Library/Application Support/GOG.com/Galaxy/plugins/data/battlenet')
+elif SYSTEM == Platform.LINUX:
+    # Battle.net installed in a Wine prefix
+    WINE_PREFIX = os.environ.get('WINEPREFIX', os.path.expanduser('~/.wine'))
+    AGENT_PATH = os.path.join(WINE_PREFIX, 'drive_c', 'ProgramData', 'Battle.net', 'Agent')
+    CONFIG_PATH = os.path.join(
+        WINE_PREFIX, 'drive_c', 'users', getpass.getuser(), 'AppData', 'Roaming', 'Battle.net', 'Battle.net.config'
+    )
+    PLUGIN_DATA_PATH = os.path.join(
+        os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'GOG.com', 'Galaxy', 'plugins', 'data',
+        'battlenet'
+    )
+
+ACHIEVEMENTS_STORE_DIR = os.path.join(PLUGIN_DATA_PATH, 'achievements')  # one log per account
+METADATA_CACHE_PATH = os.path.join(PLUGIN_DATA_PATH, 'metadata.sqlite')
+RESPONSE_CACHE_PATH = os.path.join(PLUGIN_DATA_PATH, 'responses.sqlite')
 
 CLIENT_ID = "a1b2c3"
 CLIENT_SECRET = "d4e5"
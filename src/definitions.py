@@ -12,6 +12,29 @@ License_Map = {
     "Banned": LicenseType.SinglePurchase
 }
 
+
+def _slotted_getstate(self):
+    return [getattr(self, name) for name in self.__slots__]
+
+
+def _slotted_setstate(self, state):
+    # object.__setattr__ as frozen dataclasses reject setattr; mirrors dataclass(slots=True) of Python 3.10
+    for name, value in zip(self.__slots__, state):
+        object.__setattr__(self, name, value)
+
+
+def slotted(cls):
+    """Recreates a dataclass with __slots__ instead of per-instance __dict__; apply above @dc.dataclass"""
+    fields = tuple(field.name for field in dc.fields(cls))
+    namespace = {
+        key: value for key, value in cls.__dict__.items() if key not in fields + ('__dict__', '__weakref__')
+    }
+    namespace['__slots__'] = fields
+    namespace.setdefault('__getstate__', _slotted_getstate)
+    namespace.setdefault('__setstate__', _slotted_setstate)
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
 class DataclassJSONEncoder(json.JSONEncoder):
     def default(self, o):
         if dc.is_dataclass(o):
@@ -26,7 +49,8 @@ class WebsiteAuthData(object):
     region: str
 
 
-@dc.dataclass
+@slotted
+@dc.dataclass(frozen=True)
 class BlizzardGame(object):
     uid: str
     name: str
@@ -34,19 +58,27 @@ class BlizzardGame(object):
     family: str
 
 
-@dc.dataclass
+@slotted
+@dc.dataclass(frozen=True)
 class ConfigGameInfo(object):
     uid: str
     uninstall_tag: Optional[str]
     last_played: Optional[str]
 
 
-@dc.dataclass
+@slotted
+@dc.dataclass(frozen=True)
 class ProductDbInfo(object):
     uninstall_tag: str
     ngdp: str = ''
     install_path: str = ''
     version: str = ''
+    # install/update state, None when product.db holds no cached state of the product
+    installed: Optional[bool] = None
+    playable: Optional[bool] = None
+    update_complete: Optional[bool] = None
+    update_progress: Optional[float] = None  # 0..1, meaningful only while update_complete is False
+    download_remaining: Optional[int] = None
 
 
 class Singleton(type):
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+
+NETWORK = 'network'
+PROCESS_WAIT = 'process-wait'
+FILESYSTEM = 'filesystem'
+UI = 'ui'
+
+_LIMITS = {
+    NETWORK: 8,
+    PROCESS_WAIT: 12,  # one blocking wait per running game
+    FILESYSTEM: 2,
+    UI: 1
+}
+
+
+class WorkloadExecutor(object):
+    """Bounded thread pool dedicated to one workload class, so it cannot starve the others"""
+    SLOW_WAIT = 1.0  # seconds in queue after which a call is reported
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=f'bnet-{name}')
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _wrap(self, func, args):
+        submitted = perf_counter()
+
+        def call():
+            wait = perf_counter() - submitted
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            if wait > self.SLOW_WAIT:
+                log.warning(f'{self.name} executor: call waited {wait:.2f}s in queue')
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+        return call
+
+    def _on_done(self, future):
+        if future.cancelled():  # cancelled while still queued, the call never ran
+            with self._lock:
+                self.queued -= 1
+
+    def run(self, func, *args):
+        with self._lock:
+            self.queued += 1
+        future = self._executor.submit(self._wrap(func, args))
+        future.add_done_callback(self._on_done)
+        return asyncio.wrap_future(future, loop=asyncio.get_event_loop())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'max_workers': self.max_workers,
+                'avg_wait': self.total_wait / self.completed if self.completed else 0.0,
+                'max_wait': self.max_wait
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_executors = {}
+
+
+def set_limit(name, max_workers):
+    """Overrides the pool size of a workload class; has to be called before the class is first used"""
+    if name in _executors:
+        raise RuntimeError(f'{name} executor already started')
+    _LIMITS[name] = max_workers
+
+
+def get_executor(name):
+    executor = _executors.get(name)
+    if executor is None:
+        executor = _executors[name] = WorkloadExecutor(name, _LIMITS[name])
+    return executor
+
+
+def run_in(name, func, *args):
+    """Runs blocking func in the pool of given workload class; returns awaitable"""
+    return get_executor(name).run(func, *args)
+
+
+def stats():
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+def shutdown():
+    for executor in _executors.values():
+        executor.shutdown()
+    _executors.clear()
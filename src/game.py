@@ -1,4 +1,5 @@
-from psutil import Process, wait_procs
+import os
+import sys
 
 from definitions import BlizzardGame
 from pathfinder import PathFinder
@@ -9,6 +10,8 @@ pathfinder = PathFinder(SYSTEM)
 
 
 class InstalledGame(object):
+    __slots__ = ('info', 'uninstall_tag', 'version', 'last_played', 'install_path', 'execs', '_exec_prefix')
+
     def __init__(self, info: BlizzardGame, uninstall_tag: str, version: str, last_played: str, install_path: str):
         self.info = info
         self.uninstall_tag = uninstall_tag
@@ -16,31 +19,25 @@ class InstalledGame(object):
         self.last_played = last_played
         self.install_path = install_path
 
-        self.execs = pathfinder.find_executables(self.install_path)
-        self._processes = set()
-
-    @property
-    def local_game_args(self):
-        return (self.info.blizzard_id, self.is_running)
+        root = os.path.normpath(install_path)
+        self._exec_prefix = os.path.join(root, '')
+        # interned paths relative to the install root
+        self.execs = frozenset(
+            sys.intern(os.path.relpath(path, root)) for path in pathfinder.find_executables(self.install_path)
+        )
+
+    def matches(self, uninstall_tag, version, last_played, install_path):
+        """True if the game was parsed from the same local data, so this object can be reused"""
+        return (self.uninstall_tag, self.version, self.last_played, self.install_path) == \
+            (uninstall_tag, version, last_played, install_path)
+
+    def has_exec(self, path):
+        """True if path is one of the game executables"""
+        if not path or not path.startswith(self._exec_prefix):
+            return False
+        return path[len(self._exec_prefix):] in self.execs
 
     @property
     def playable(self):
         if self.version != '':
             return True
-
-    def add_process(self, process: Process):
-        if process.exe() in self.execs:
-            self._processes.add(process)
-        else:
-            raise ValueError(f"The process exe [{process.exe()}] doesn't match with the game execs: {self.execs}")
-
-    def is_running(self):
-        for process in self._processes:
-            if process.is_running():
-                return True
-        else:
-            self._processes = set()
-            return False
-
-    def wait_until_game_stops(self, timeout=None):
-        wait_procs(self._processes, timeout=timeout, callback=None)
@@ -2,6 +2,11 @@ from definitions import WebsiteAuthData
 import logging as log
 import pickle
 import asyncio
+import base64
+import hashlib
+import json
+import zlib
+from time import time, perf_counter
 
 import requests
 import requests.cookies
@@ -12,6 +17,8 @@ from galaxy.api.errors import InvalidCredentials
 from galaxy.api.types import Authentication, NextStep
 from galaxy.api.jsonrpc import Aborted
 
+from executors import run_in, NETWORK
+from response_cache import new_key
 from consts import CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, FIREFOX_AGENT
 
 
@@ -33,7 +40,94 @@ def _found_region(cookies):
         return 'eu'
 
 
+CREDENTIALS_VERSION = 2
+RELEVANT_COOKIE_DOMAINS = ('battle.net', 'blizzard.com')
+
+
+def _is_relevant_cookie(cookie, now):
+    if cookie.expires and cookie.expires <= now:
+        return False
+    domain = cookie.domain.lstrip('.')
+    # cookies parsed from the login web view carry no domain
+    return not domain or any(domain == d or domain.endswith('.' + d) for d in RELEVANT_COOKIE_DOMAINS)
+
+
+def encode_cookies(cookie_jar):
+    """Serializes only live Battle.net cookies as base64 of zlib compressed JSON"""
+    now = time()
+    cookies = [
+        [cookie.name, cookie.value, cookie.domain, cookie.path, cookie.expires]
+        for cookie in cookie_jar if _is_relevant_cookie(cookie, now)
+    ]
+    raw = json.dumps(cookies, separators=(',', ':')).encode('utf-8')
+    return base64.b64encode(zlib.compress(raw, 9)).decode('ascii')
+
+
+def decode_cookies(data):
+    cookie_jar = requests.cookies.RequestsCookieJar()
+    for name, value, domain, path, expires in json.loads(zlib.decompress(base64.b64decode(data))):
+        cookie_jar.set(name, value, domain=domain, path=path, expires=expires)
+    return cookie_jar
+
+
+def _credentials_digest(credentials):
+    return hashlib.sha1(json.dumps(credentials, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class AuthLifecycle(object):
+    """Keeps track of access token and session cookies expiry to refresh them before they run out"""
+    REFRESH_MARGIN = 300  # seconds before expiry when a proactive refresh is due
+    MIN_REFRESH_INTERVAL = 600  # cookies not extended by a refresh must not cause a refresh loop
+    SESSION_COOKIES = ('BA-tassadar', 'web.id')  # tracking or XSRF cookies expiring sooner do not matter
+    ASSUMED_SESSION_LIFETIME = 12 * 3600  # for session cookies without expiry, e.g. from the login web view
+
+    def __init__(self):
+        self.token_expires_at = None
+        self.cookies_expire_at = None
+        self.last_refresh = None
+
+    def update_token(self, auth_status):
+        """:param auth_status  check_token response; its 'exp' field is token expiry as unix timestamp"""
+        exp = auth_status.get('exp') if isinstance(auth_status, dict) else None
+        self.token_expires_at = float(exp) if exp else None
+
+    def update_cookies(self, cookie_jar):
+        now = time()
+        session_cookies = [cookie for cookie in cookie_jar if cookie.name in self.SESSION_COOKIES]
+        expirations = [cookie.expires for cookie in session_cookies if cookie.expires and cookie.expires > now]
+        if expirations:
+            self.cookies_expire_at = min(expirations)
+        elif session_cookies and self.last_refresh is not None:
+            self.cookies_expire_at = self.last_refresh + self.ASSUMED_SESSION_LIFETIME
+        else:
+            self.cookies_expire_at = None
+
+    def refreshed(self, cookie_jar):
+        self.last_refresh = time()
+        self.update_cookies(cookie_jar)
+
+    def session_valid(self):
+        """Stored session cookies are known to outlive the refresh margin"""
+        return self.cookies_expire_at is not None and self.cookies_expire_at - time() > self.REFRESH_MARGIN
+
+    def token_expired(self):
+        return self.token_expires_at is not None and self.token_expires_at <= time()
+
+    def forget_token(self):
+        """Expired token is not checked any more, the plugin goes on with the cookie session"""
+        self.token_expires_at = None
+
+    def needs_refresh(self):
+        now = time()
+        if self.last_refresh is not None and now - self.last_refresh < self.MIN_REFRESH_INTERVAL:
+            return False
+        return self.cookies_expire_at is not None and self.cookies_expire_at - now <= self.REFRESH_MARGIN
+
+
 class AuthenticatedHttpClient(object):
+    CREDENTIALS_STORE_DELAY = 2  # seconds to coalesce bursts of credential refreshes
+    PREWARM_TIMEOUT = 5.0
+
     def __init__(self, plugin):
         self._plugin = plugin
         self.user_details = None
@@ -43,17 +137,38 @@ class AuthenticatedHttpClient(object):
         self.timeout = 10.0
         self.attempted_to_set_battle_tag = None
         self.auth_data = None
+        self.auth_lifecycle = AuthLifecycle()
+        self._stored_credentials_digest = None
+        self._pending_credentials_store = None
+        self.prewarm_enabled = True
+        self.prewarm_timings = {}
+        self._cache_key = None
+
+    @property
+    def cache_key(self):
+        """Key encrypting this account's cached backend responses, kept in stored credentials"""
+        if self._cache_key is None:
+            self._cache_key = new_key()
+        return self._cache_key
 
     def is_authenticated(self):
         return self.session is not None
 
     async def shutdown(self):
-        await self.session.close()
-        self.session = None
+        if self.session is None:
+            return
+        session, self.session = self.session, None
+        await run_in(NETWORK, session.close)  # requests.Session.close is blocking, not a coroutine
 
     def process_stored_credentials(self, stored_credentials):
+        if stored_credentials.get('version', 1) >= 2:
+            cookie_jar = decode_cookies(stored_credentials['cookies'])
+        else:
+            cookie_jar = pickle.loads(bytes.fromhex(stored_credentials['cookie_jar']))
+        self._stored_credentials_digest = _credentials_digest(stored_credentials)
+        self._cache_key = stored_credentials.get('cache_key')
         auth_data = WebsiteAuthData(
-            cookie_jar=pickle.loads(bytes.fromhex(stored_credentials['cookie_jar'])),
+            cookie_jar=cookie_jar,
             access_token=stored_credentials['access_token'],
             region=stored_credentials['region'] if 'region' in stored_credentials else 'eu'
         )
@@ -65,7 +180,6 @@ class AuthenticatedHttpClient(object):
 
     async def get_auth_data_login(self, cookie_jar, credentials):
         code = parse_qs(urlparse(credentials['end_uri']).query)["code"][0]
-        loop = asyncio.get_running_loop()
 
         s = requests.Session()
         url = f"https://{self.region}.battle.net/oauth/token"
@@ -77,7 +191,7 @@ class AuthenticatedHttpClient(object):
             "code": code
         }
         log.info(f"data {data}")
-        response = await loop.run_in_executor(None, partial(s.post, url, data=data))
+        response = await run_in(NETWORK, partial(s.post, url, data=data))
         response.raise_for_status()
         result = response.json()
         access_token = result["access_token"]
@@ -126,7 +240,7 @@ class AuthenticatedHttpClient(object):
         except KeyError:
             log.error("User failed to set battle tag")
             raise InvalidCredentials()
-        self._plugin.store_credentials(self.creds)
+        self._store_credentials(self.creds)
         return Authentication(self.user_details["id"], battletag)
 
     def parse_cookies(self, cookies):
@@ -135,8 +249,7 @@ class AuthenticatedHttpClient(object):
         return requests.cookies.cookiejar_from_dict(new_cookies)
 
     def set_credentials(self):
-        self.creds = {"cookie_jar": pickle.dumps(self.auth_data.cookie_jar).hex(), "access_token": self.auth_data.access_token,
-                      "user_details_cache": self.user_details, "region": self.auth_data.region}
+        self.creds = self._build_credentials(self.auth_data.cookie_jar)
 
     def parse_battletag(self):
         try:
@@ -154,7 +267,7 @@ class AuthenticatedHttpClient(object):
             self.attempted_to_set_battle_tag = True
             return NextStep("web_session", auth_params)
 
-        self._plugin.store_credentials(self.creds)
+        self._store_credentials(self.creds)
         return Authentication(self.user_details["id"], battletag)
 
     async def create_session(self):
@@ -166,11 +279,77 @@ class AuthenticatedHttpClient(object):
             "Authorization": f"Bearer {self.auth_data.access_token}",
             "User-Agent": FIREFOX_AGENT
         }
+        self.auth_lifecycle.update_cookies(self.session.cookies)
 
-    def refresh_credentials(self):
-        creds = {
-            "cookie_jar": pickle.dumps(self.session.cookie_jar).hex(),
-            "access_token": self.auth_data.access_token
+    def _region_hosts(self):
+        return [
+            f"{self.region}.account.blizzard.com",
+            f"{self.region}.battle.net",
+            f"{self.region}.api.blizzard.com"
+        ]
+
+    def _warm_host(self, host):
+        """Opens a pooled keep-alive connection to host; DNS, TCP and TLS are paid here instead of by the first call.
+        The HEAD goes straight to the session's adapter, so it carries neither session headers nor cookies and
+        its response cannot change the cookie jar.
+        """
+        url = f"https://{host}/"
+        start = perf_counter()
+        request = requests.Request("HEAD", url).prepare()
+        response = self.session.get_adapter(url).send(request, timeout=self.PREWARM_TIMEOUT)
+        response.content  # consuming the (empty) body puts the connection back into the pool
+        return perf_counter() - start
+
+    async def prewarm(self):
+        """Connects to all hosts of the current region in parallel, waiting at most PREWARM_TIMEOUT"""
+        if not self.prewarm_enabled or self.session is None:
+            return
+        hosts = self._region_hosts()
+        start = perf_counter()
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*[run_in(NETWORK, self._warm_host, host) for host in hosts], return_exceptions=True),
+                self.PREWARM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            log.debug(f"Pre-warming connections timed out after {self.PREWARM_TIMEOUT}s")
+            return
+        for host, result in zip(hosts, results):
+            if isinstance(result, Exception):
+                log.debug(f"Pre-warming {host} failed: {repr(result)}")
+                continue
+            self.prewarm_timings[host] = result
+        log.info(
+            f"Pre-warmed connections in {perf_counter() - start:.3f}s, connection setup per host: "
+            + ", ".join(f"{host}={elapsed:.3f}s" for host, elapsed in self.prewarm_timings.items())
+        )
+
+    def _build_credentials(self, cookie_jar):
+        return {
+            "version": CREDENTIALS_VERSION,
+            "cookies": encode_cookies(cookie_jar),
+            "access_token": self.auth_data.access_token,
+            "user_details_cache": self.user_details,
+            "region": self.auth_data.region,
+            "cache_key": self.cache_key
         }
 
-        self._plugin.store_credentials(creds)
+    def _store_credentials(self, credentials):
+        if self._pending_credentials_store is not None:
+            self._pending_credentials_store.cancel()
+            self._pending_credentials_store = None
+        self._stored_credentials_digest = _credentials_digest(credentials)
+        self._plugin.store_credentials(credentials)
+
+    def refresh_credentials(self):
+        """Stores current session cookies, debounced and only when they differ from what is already stored"""
+        self.creds = self._build_credentials(self.session.cookies)
+        if _credentials_digest(self.creds) == self._stored_credentials_digest:
+            log.debug("Credentials unchanged, not storing")
+            return
+        if self._pending_credentials_store is not None:
+            self._pending_credentials_store.cancel()
+        loop = asyncio.get_event_loop()
+        self._pending_credentials_store = loop.call_later(
+            self.CREDENTIALS_STORE_DELAY, self._store_credentials, self.creds
+        )
@@ -2,7 +2,6 @@ import re
 import os
 import asyncio
 import logging as log
-import shutil
 import subprocess
 import abc
 from time import time
@@ -13,12 +12,16 @@ from definitions import Blizzard
 from process import ProcessProvider
 from game import InstalledGame
 from consts import Platform, SYSTEM
+from executors import run_in, FILESYSTEM
 
 if SYSTEM == Platform.WINDOWS:
     import winreg
     import ctypes
 elif SYSTEM == Platform.MACOS:
     from Quartz import CGWindowListCopyWindowInfo, kCGNullWindowID, kCGWindowListExcludeDesktopElements
+elif SYSTEM == Platform.LINUX:
+    import procfs
+    from consts import WINE_PREFIX
 
 
 class ClientNotInstalledError(Exception):
@@ -42,13 +45,84 @@ class WinUninstaller(object):
         subprocess.Popen(args, cwd=os.path.dirname(self.path))
 
 
+class LinuxUninstaller(WinUninstaller):
+    """Blizzard Uninstaller.exe run through Wine"""
+
+    def uninstall_game(self, game, uninstall_tag, lang):
+        args = [
+            'wine',
+            str(self.path),
+            f'--lang={lang}',
+            f'--uid={uninstall_tag}',
+            f'--displayname={game.info.name}'
+        ]
+        subprocess.Popen(args, cwd=os.path.dirname(self.path), env=dict(os.environ, WINEPREFIX=WINE_PREFIX))
+
+
+class UninstallJob(object):
+    """Removes a directory tree in chunks on the filesystem executor; can be cancelled between chunks"""
+    CHUNK_SIZE = 500  # filesystem entries removed per executor call
+    PROGRESS_STEP = 10  # percents between progress reports
+
+    def __init__(self, path):
+        self.path = path
+        self.total = None
+        self.removed = 0
+        self._entries = []
+        self._cancelled = False
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 0
+        return 100 * self.removed // self.total
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _collect(self):
+        entries = []
+        for root, dirs, files in os.walk(self.path, topdown=False):
+            entries.extend((os.path.join(root, name), False) for name in files)
+            entries.extend((os.path.join(root, name), True) for name in dirs)
+        entries.append((self.path, True))
+        entries.reverse()  # entries are popped from the end, so children go before their parents
+        return entries
+
+    def _remove_chunk(self):
+        for _ in range(min(self.CHUNK_SIZE, len(self._entries))):
+            path, is_dir = self._entries.pop()
+            try:
+                if is_dir and not os.path.islink(path):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.removed += 1
+
+    async def run(self):
+        self._entries = await run_in(FILESYSTEM, self._collect)
+        self.total = len(self._entries)
+        log.info(f'Uninstalling {self.path}: {self.total} entries to remove')
+        reported = 0
+        while self._entries:
+            if self._cancelled:
+                raise asyncio.CancelledError()
+            await run_in(FILESYSTEM, self._remove_chunk)
+            if self.progress >= reported + self.PROGRESS_STEP:
+                reported = self.progress
+                log.info(f'Uninstalling {self.path}: {reported}%')
+
+
 class MacUninstaller(object):
     def __init__(self):
         pass
 
     def uninstall_game(self, game, uninstall_tag, lang):
+        """:returns UninstallJob removing game files when run"""
         log.info(f"INSTALL_PATH: {game.install_path}")
-        shutil.rmtree(game.install_path)
+        return UninstallJob(game.install_path)
 
 
 class _LocalClient(abc.ABC):
@@ -56,6 +130,7 @@ class _LocalClient(abc.ABC):
         self._process_provider = ProcessProvider()
         self._process = None
         self._exe = self._find_exe()
+        self.launch_timings = {}
 
     @abc.abstractproperty
     def is_installed(self):
@@ -79,6 +154,17 @@ class _LocalClient(abc.ABC):
     def refresh(self):
         self._exe = self._find_exe()
 
+    def local_path(self, path):
+        """Translates path read from Battle.net data files to the local filesystem"""
+        return path
+
+    def _run_client(self, *args):
+        subprocess.Popen([self._exe, *args], cwd=os.path.dirname(self._exe))
+
+    def _send_launch_command(self, game):
+        cmd = f'"{self._exe}" --exec="launch {game.info.family}"'
+        subprocess.Popen(cmd, cwd=os.path.dirname(self._exe), shell=True)
+
     def is_running(self):
         if self._process and self._process.is_running():
             return True
@@ -86,38 +172,54 @@ class _LocalClient(abc.ABC):
             self._process = self._process_provider.get_process_by_path(self._exe)
             return bool(self._process)
 
+    async def _wait_for(self, predicate, timeout, initial_delay=0.05, max_delay=1.0):
+        """Polls predicate with exponentially growing delays until it holds
+        :param timeout  timestamp when waiting should be stopped
+        :returns        True if predicate held before timeout
+        """
+        delay = initial_delay
+        while True:
+            if predicate():
+                return True
+            remaining = timeout - time()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(max_delay, delay * 2)
+
+    def _phase_done(self, phase, started):
+        self.launch_timings[phase] = time() - started
+        log.debug(f'Launch phase {phase} took {self.launch_timings[phase]:.2f}s')
+        return time()
+
     async def _prepare_to_launch(self, uid, timeout):
         """launches the client and waits till proper renderer is opened
         :param uid      str of game uid. Makes login window game oriented
         :param timeout  timestamp when a watch should be stopped
         """
+        started = time()
         if self.is_running() and self._is_main_window_open():
+            self._phase_done('client_start', started)
             return
 
-        subprocess.Popen([self._exe, f'--game={uid}'], cwd=os.path.dirname(self._exe))
-        while time() < timeout:
-            if self._is_main_window_open():
-                log.debug('Preparing to launch ended {:.2f}s before timeout'.format(timeout - time()))
-                return
-            await asyncio.sleep(0.2)
-        raise TimeoutError(f'Timeout reached when waiting for gameview from Battle.net')
+        self._run_client(f'--game={uid}')
+        # only the window is polled; looking the client process up by path scans all processes
+        if not await self._wait_for(self._is_main_window_open, timeout, initial_delay=0.1):
+            raise TimeoutError('Timeout reached when waiting for gameview from Battle.net')
+        self._phase_done('client_start', started)
+        log.debug('Preparing to launch ended {:.2f}s before timeout'.format(timeout - time()))
 
     def install_game(self, id):
         if not self.is_installed:
             raise ClientNotInstalledError()
         game = Blizzard[id]
-        args = [
-            self._exe,
-            "--install",
-            f"--game={game.uid}"
-        ]
-        subprocess.Popen(args, cwd=os.path.dirname(self._exe))
+        self._run_client("--install", f"--game={game.uid}")
 
     async def wait_until_game_stops(self, game: InstalledGame):
         if not self.is_running():
             return 'Client not running'
         for child in self._process.children():
-            if child.exe() in game.execs:
+            if game.has_exec(child.exe()):
                 game_process = child
                 break
         else:
@@ -128,21 +230,28 @@ class _LocalClient(abc.ABC):
             await asyncio.sleep(1)
 
     async def launch_game(self, game: InstalledGame, wait_sec):
+        """Runs launch phases: client start (until its main window is ready), launch command sent, game process seen.
+        Duration of every phase is kept in launch_timings.
+        """
         if not self.is_installed:
             raise ClientNotInstalledError()
         timeout = time() + wait_sec
+        self.launch_timings = {}
 
-        await self._prepare_to_launch(game.info.uid, timeout)
+        try:
+            await self._prepare_to_launch(game.info.uid, timeout)
 
-        cmd = f'"{self._exe}" --exec="launch {game.info.family}"'
-        subprocess.Popen(cmd, cwd=os.path.dirname(self._exe), shell=True)
-        log.info(f"Launch game and start waiting for game process")
+            started = time()
+            self._send_launch_command(game)
+            started = self._phase_done('launch_command_sent', started)
+            log.info(f"Launch game and start waiting for game process")
 
-        while time() < timeout:
-            if self._check_for_game_process(game):
-                return
-            await asyncio.sleep(0.5)
-        raise TimeoutError(f"Game process has not appear within {wait_sec}s")
+            if not await self._wait_for(lambda: self._check_for_game_process(game), timeout, initial_delay=0.25):
+                raise TimeoutError(f"Game process has not appear within {wait_sec}s")
+            self._phase_done('game_process_seen', started)
+        finally:
+            log.info(f'Launch phases of {game.info.uid}: ' +
+                     ', '.join(f'{phase}={elapsed:.2f}s' for phase, elapsed in self.launch_timings.items()))
 
 
 class WinLocalClient(_LocalClient):
@@ -180,7 +289,7 @@ class WinLocalClient(_LocalClient):
                 return False
             with self._process.oneshot():
                 for proc in self._process.children():
-                    if proc.exe() in game.execs:
+                    if game.has_exec(proc.exe()):
                         log.debug(f'Process has been found')
                         return True
         except (psutil.AccessDenied, psutil.NoSuchProcess):
@@ -237,10 +346,76 @@ class MacLocalClient(_LocalClient):
     def _check_for_game_process(self, game):
         """Check over all processes because on macOS games are spawn not as client children"""
         for proc in psutil.process_iter(attrs=['exe'], ad_value=''):
-            if proc.info['exe'] in game.execs:
+            if game.has_exec(proc.info['exe']):
+                return True
+        return False
+
+
+class LinuxLocalClient(_LocalClient):
+    """Battle.net installed in a Wine prefix. Processes are found by reading /proc directly."""
+    _PATH = r'C:\Program Files (x86)\Battle.net\Battle.net.exe'
+    _RENDERER = 'Battle.net Helper.exe'
+
+    def _find_exe(self):
+        return procfs.wine_to_unix_path(self._PATH)
+
+    def local_path(self, path):
+        return procfs.wine_to_unix_path(path)
+
+    @property
+    def is_installed(self):
+        return os.path.exists(self._exe)
+
+    def _wine_env(self):
+        return dict(os.environ, WINEPREFIX=WINE_PREFIX)
+
+    def _run_client(self, *args):
+        subprocess.Popen(['wine', self._exe, *args], cwd=os.path.dirname(self._exe), env=self._wine_env())
+
+    def _send_launch_command(self, game):
+        subprocess.Popen(
+            ['wine', self._exe, f'--exec=launch {game.info.family}'],
+            cwd=os.path.dirname(self._exe), env=self._wine_env()
+        )
+
+    def is_running(self):
+        if self._process is not None and procfs.process_exe(self._process) == self._exe:
+            return True
+        for pid, exe in procfs.iter_processes():
+            if exe == self._exe:
+                self._process = pid
                 return True
+        self._process = None
         return False
 
+    def _is_main_window_open(self):
+        """There is no portable way to list Wine windows; the main window is assumed to be ready
+        once the client spawned its renderer process"""
+        client_dir = os.path.dirname(self._exe)
+        for _, exe in procfs.iter_processes():
+            if os.path.basename(exe) == self._RENDERER and exe.startswith(client_dir):
+                return True
+        return False
+
+    def close_window(self):
+        """Not implemented: Wine windows cannot be reached without an X11/Wayland client library"""
+
+    def _check_for_game_process(self, game):
+        for _, exe in procfs.iter_processes():
+            if game.has_exec(exe):
+                return True
+        return False
+
+    async def wait_until_game_stops(self, game: InstalledGame):
+        for pid, exe in procfs.iter_processes():
+            if game.has_exec(exe):
+                break
+        else:
+            return 'No process matches'
+        while procfs.process_exe(pid) is not None:
+            await asyncio.sleep(1)
+        return 'Game process is no longer running'
+
 
 if SYSTEM == Platform.WINDOWS:
     LocalClient = WinLocalClient
@@ -248,3 +423,6 @@ if SYSTEM == Platform.WINDOWS:
 elif SYSTEM == Platform.MACOS:
     LocalClient = MacLocalClient
     Uninstaller = MacUninstaller
+elif SYSTEM == Platform.LINUX:
+    LocalClient = LinuxLocalClient
+    Uninstaller = LinuxUninstaller
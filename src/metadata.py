@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import asyncio
+import threading
+import logging as log
+from time import time
+
+from executors import run_in, FILESYSTEM
+
+
+def api_locale(language):
+    """Battle.net client language (enUS) to the locale used by the game data APIs (en_US)"""
+    return f'{language[:2]}_{language[2:]}'
+
+
+def parse_wow_achievements(document):
+    """Flattens /wow/data/character/achievements into (id, title, description, category, points) rows"""
+    rows = []
+    groups = [(group, group.get('name', '')) for group in document.get('achievements', [])]
+    while groups:
+        group, category = groups.pop()
+        for achievement in group.get('achievements', []):
+            rows.append((
+                achievement['id'], achievement.get('title', ''), achievement.get('description', ''),
+                category, achievement.get('points', 0)
+            ))
+        groups.extend((subgroup, subgroup.get('name', category)) for subgroup in group.get('categories', []))
+    return rows
+
+
+def parse_sc2_achievements(document):
+    """Flattens /sc2/static/profile into (id, title, description, category, points) rows"""
+    categories = {category['id']: category.get('name', '') for category in document.get('categories', [])}
+    return [
+        (
+            int(achievement['id']), achievement.get('title', ''), achievement.get('description', ''),
+            categories.get(achievement.get('categoryId'), ''), achievement.get('points', 0)
+        )
+        for achievement in document.get('achievements', [])
+    ]
+
+
+class AchievementMetadataCache(object):
+    """SQLite cache of static achievement definitions, versioned per game and locale.
+
+    A locale is filled in bulk from a single metadata document. Its ETag is kept next to the rows and the
+    document is revalidated at most once per REVALIDATE_INTERVAL, so name lookups normally stay local.
+    """
+    SCHEMA_VERSION = 2
+    REVALIDATE_INTERVAL = 24 * 3600
+    _QUERY_CHUNK = 500  # stays below SQLite's default limit of bound parameters
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+        self._refresh_locks = {}
+
+    def _connect(self):
+        if self._connection is not None:
+            return self._connection
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            log.warning(f'Achievement metadata cache {self.path} is corrupted, recreating: {repr(e)}')
+            connection.close()
+            os.remove(self.path)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            version = 0
+        if version != self.SCHEMA_VERSION:
+            with connection:
+                connection.executescript(f'''
+                    DROP TABLE IF EXISTS versions;
+                    DROP TABLE IF EXISTS achievements;
+                    DROP TABLE IF EXISTS titles;
+                    CREATE TABLE versions (
+                        game TEXT, locale TEXT, etag TEXT, validated_at REAL,
+                        PRIMARY KEY (game, locale)
+                    );
+                    CREATE TABLE achievements (
+                        game TEXT, locale TEXT, achievement_id INTEGER,
+                        title TEXT, description TEXT, category TEXT, points INTEGER,
+                        PRIMARY KEY (game, locale, achievement_id)
+                    ) WITHOUT ROWID;
+                    PRAGMA user_version = {self.SCHEMA_VERSION};
+                ''')
+        self._connection = connection
+        return connection
+
+    def _execute(self, func, *args):
+        with self._lock:
+            return func(self._connect(), *args)
+
+    @staticmethod
+    def _version(connection, game, locale):
+        return connection.execute(
+            'SELECT etag, validated_at FROM versions WHERE game = ? AND locale = ?', (game, locale)
+        ).fetchone()
+
+    @staticmethod
+    def _replace(connection, game, locale, etag, rows):
+        with connection:
+            connection.execute('DELETE FROM achievements WHERE game = ? AND locale = ?', (game, locale))
+            connection.executemany(
+                'INSERT OR REPLACE INTO achievements VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((game, locale, *row) for row in rows)
+            )
+            connection.execute('INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?)', (game, locale, etag, time()))
+
+    @staticmethod
+    def _revalidated(connection, game, locale):
+        with connection:
+            connection.execute(
+                'UPDATE versions SET validated_at = ? WHERE game = ? AND locale = ?', (time(), game, locale)
+            )
+
+    def _select(self, connection, game, locale, achievement_ids):
+        names = {}
+        for start in range(0, len(achievement_ids), self._QUERY_CHUNK):
+            chunk = achievement_ids[start:start + self._QUERY_CHUNK]
+            names.update(connection.execute(
+                f'SELECT achievement_id, title FROM achievements WHERE game = ? AND locale = ? '
+                f'AND achievement_id IN ({",".join("?" * len(chunk))})',
+                (game, locale, *chunk)
+            ))
+        return names
+
+    async def refresh(self, game, locale, fetch):
+        """Fills or revalidates metadata of game in given locale unless it was validated recently
+        :param fetch    coroutine function taking the stored ETag (or None) and returning (rows, etag),
+                        where rows is None when the document has not changed
+        """
+        lock = self._refresh_locks.setdefault((game, locale), asyncio.Lock())
+        async with lock:
+            version = await run_in(FILESYSTEM, self._execute, self._version, game, locale)
+            etag, validated_at = version if version else (None, None)
+            if validated_at is not None and time() - validated_at < self.REVALIDATE_INTERVAL:
+                return
+            rows, new_etag = await fetch(etag)
+            if rows is None:
+                log.debug(f'Achievement metadata of {game} ({locale}) not modified')
+                await run_in(FILESYSTEM, self._execute, self._revalidated, game, locale)
+                return
+            log.info(f'Storing {len(rows)} achievement definitions of {game} ({locale})')
+            await run_in(FILESYSTEM, self._execute, self._replace, game, locale, new_etag, rows)
+
+    async def achievement_names(self, game, locale, achievement_ids):
+        """:returns    dict achievement_id: title of the ids known to the cache"""
+        return await run_in(FILESYSTEM, self._execute, self._select, game, locale, list(achievement_ids))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,55 @@
+import asyncio
+import logging as log
+from time import time
+
+
+class StatusNotifier(object):
+    """Batches local game status changes.
+    Changes are collected until none arrived for `delay` seconds (but no longer than `max_delay`), then every
+    game is published once with its final state. A game whose final state equals the last published one is
+    skipped, so transient sequences such as None_ -> Installed -> None_ never reach Galaxy.
+    """
+
+    def __init__(self, publish, delay=0.5, max_delay=2.0):
+        """:param publish   callable(list of (game_id, state)), called once per batch"""
+        self._publish = publish
+        self.delay = delay
+        self.max_delay = max_delay
+        self._published = {}  # game_id -> state last known to Galaxy
+        self._pending = {}  # game_id -> latest state, in order of the first change
+        self._first_change = None
+        self._timer = None
+
+    def update(self, game_id, state):
+        self._pending[game_id] = state
+        now = time()
+        if self._first_change is None:
+            self._first_change = now
+        if self._timer is not None:
+            self._timer.cancel()
+        wait = min(self.delay, self._first_change + self.max_delay - now)
+        self._timer = asyncio.get_event_loop().call_later(max(0, wait), self.flush)
+
+    def reported(self, game_id, state):
+        """State sent to Galaxy outside of notifications, e.g. in get_local_games response"""
+        self._published[game_id] = state
+
+    def flush(self):
+        self.cancel()
+        pending, self._pending = self._pending, {}
+        changes = [(game_id, state) for game_id, state in pending.items() if self._published.get(game_id) != state]
+        if len(changes) < len(pending):
+            log.debug(f'Dropped {len(pending) - len(changes)} status changes ending in the published state')
+        if not changes:
+            return
+        self._published.update(changes)
+        try:
+            self._publish(changes)
+        except Exception as e:
+            log.exception(f'Publishing local game statuses failed: {repr(e)}')
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._first_change = None
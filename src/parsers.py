@@ -1,3 +1,5 @@
+import struct
+import dataclasses as dc
 import logging as log
 
 from definitions import ProductDbInfo, ConfigGameInfo
@@ -48,6 +50,41 @@ class ConfigParser(object):
         return games
 
 
+def _read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+def _iter_fields(data):
+    """Yields (field number, value) of a serialized protobuf message; length-delimited values are bytes"""
+    offset = 0
+    while offset < len(data):
+        key, offset = _read_varint(data, offset)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, offset = _read_varint(data, offset)
+        elif wire_type == 1:
+            value, = struct.unpack_from('<d', data, offset)  # only doubles are used in product.db
+            offset += 8
+        elif wire_type == 2:
+            size, offset = _read_varint(data, offset)
+            value = data[offset:offset + size]
+            offset += size
+        elif wire_type == 5:
+            value, = struct.unpack_from('<f', data, offset)
+            offset += 4
+        else:
+            raise RuntimeError(f'Parsing product.db failed: unsupported wire type {wire_type}')
+        yield field, value
+
+
 class DatabaseParser(object):
     NOT_GAMES = ('bna', 'agent')
     CLUSTER_SIZE = 128
@@ -69,7 +106,57 @@ class DatabaseParser(object):
             return [v for k, v in self.products.items() if k not in self.NOT_GAMES]
         return []
 
+    # product.db protobuf field numbers
+    _PRODUCT_INSTALL = 1
+    _PRODUCT_CODE = 2
+    _CACHED_PRODUCT_STATE = 4
+    _BASE_PRODUCT_STATE = 1
+    _UPDATE_PROGRESS = 4
+    _BASE_STATE_FIELDS = {1: 'installed', 2: 'playable', 3: 'update_complete'}
+    _UPDATE_PROGRESS_FIELDS = {2: 'update_progress', 5: 'download_remaining'}
+
+    def _parse_install_states(self):
+        """Reads install/update state of every product
+        :returns    dict product code: dict of ProductDbInfo state fields; products without cached state are left out
+        """
+        states = {}
+        for field, product_install in _iter_fields(self.data):
+            if field != self._PRODUCT_INSTALL:
+                continue
+            code = None
+            state = None
+            for field, value in _iter_fields(product_install):
+                if field == self._PRODUCT_CODE:
+                    code = value.decode('utf-8')
+                elif field == self._CACHED_PRODUCT_STATE:
+                    state = {}
+                    for state_field, state_value in _iter_fields(value):
+                        if state_field == self._BASE_PRODUCT_STATE:
+                            names = self._BASE_STATE_FIELDS
+                        elif state_field == self._UPDATE_PROGRESS:
+                            names = self._UPDATE_PROGRESS_FIELDS
+                        else:
+                            continue
+                        for number, number_value in _iter_fields(state_value):
+                            if number in names:
+                                state[names[number]] = number_value
+            if code is not None and state is not None:
+                # fields absent from a present state hold protobuf defaults
+                states[code] = {
+                    'installed': bool(state.get('installed', False)),
+                    'playable': bool(state.get('playable', False)),
+                    'update_complete': bool(state.get('update_complete', False)),
+                    'update_progress': float(state.get('update_progress', 0.0)),
+                    'download_remaining': int(state.get('download_remaining', 0))
+                }
+        return states
+
     def parse(self):
+        try:
+            states = self._parse_install_states()
+        except Exception as e:
+            log.warning(f'Reading install states from product.db failed: {repr(e)}')
+            states = {}
         self.products = {}
         offset = 1
         while True:
@@ -86,6 +173,8 @@ class DatabaseParser(object):
             except:
                 product = None
             if product:
+                if product.ngdp in states:
+                    product = dc.replace(product, **states[product.ngdp])
                 self.products[product.ngdp] = product
 
     def _parse_next(self, section, offset, encoding='utf-8'):
@@ -6,7 +6,7 @@ from consts import Platform
 
 class PathFinder(object):
     def __init__(self, system):
-        if system == Platform.WINDOWS:
+        if system in (Platform.WINDOWS, Platform.LINUX):  # games run under Wine on Linux
             self.is_exe = self.__is_windows_exe
         else:
             self.is_exe = self.__is_posix_exe
@@ -11,22 +11,35 @@ import logging as log
 
 from version import __version__ as version
 
+from psutil import wait_procs
+
 from galaxy.api.consts import LocalGameState, Platform
 from galaxy.api.errors import AuthenticationRequired, InvalidCredentials, BackendError
 from galaxy.api.plugin import Plugin, create_and_run_plugin
 from galaxy.api.types import Achievement, Game, LicenseInfo, LocalGame
 from galaxy.api.jsonrpc import Aborted
 
+import executors
 from process import ProcessProvider
 from local_client import LocalClient, Uninstaller, ClientNotInstalledError
 from parsers import ConfigParser, DatabaseParser
 from backend import BackendClient, AccessTokenExpired
-from definitions import Blizzard, DataclassJSONEncoder, License_Map
+from definitions import Blizzard, License_Map
 from game import InstalledGame
-from watcher import FileWatcher
-from consts import CONFIG_PATH, AGENT_PATH, SYSTEM
+from watcher import create_file_watcher
+from achievements import AchievementsStore, merge_unlocks
+from metadata import AchievementMetadataCache, api_locale, parse_wow_achievements, parse_sc2_achievements
+from progress import ProgressReporter
+from notifications import StatusNotifier
+from state import LocalGamesState
+from consts import CONFIG_PATH, AGENT_PATH, ACHIEVEMENTS_STORE_DIR, METADATA_CACHE_PATH, RESPONSE_CACHE_PATH, SYSTEM, \
+    LOCALE, PLUGIN_DATA_PATH
 from consts import Platform as pf
 from http_client import AuthenticatedHttpClient
+from response_cache import ResponseCache
+from resilience import deadline
+from scheduler import Scheduler
+from profiling import RpcProfiler
 
 
 def load_product_db(product_db_path):
@@ -44,46 +57,83 @@ def load_config(battlenet_config_path):
 class BNetPlugin(Plugin):
     PRODUCT_DB_PATH = pathlib.Path(AGENT_PATH) / 'product.db'
     CONFIG_PATH = CONFIG_PATH
+    SC2_PROFILES_CONCURRENCY = 4
+    AUTHENTICATION_TIMEOUT = 30
+    PROFILED_METHODS = (
+        'authenticate', 'pass_login_credentials', 'get_owned_games', 'get_local_games', 'launch_game',
+        'install_game', 'uninstall_game', 'tick'
+    )
 
     def __init__(self, reader, writer, token):
+        # handlers are wrapped before the base class registers them
+        self.profiler = RpcProfiler.from_environment(PLUGIN_DATA_PATH)
+        for method in self.PROFILED_METHODS:
+            setattr(self, method, self.profiler.wrap(method, getattr(self, method)))
         super().__init__(Platform.Battlenet, version, reader, writer, token)
 
         log.info(f"Starting Battle.net plugin, version {version}")
 
-        self.bnet_client = None
         self.local_client = LocalClient()
         self.authentication_client = AuthenticatedHttpClient(self)
-        self.backend_client = BackendClient(self, self.authentication_client)
-        self.error_state = False
-
-        self.running_task = None
+        self.response_cache = ResponseCache(RESPONSE_CACHE_PATH)
+        self.backend_client = BackendClient(self, self.authentication_client, self.response_cache)
 
         self.database_parser = None
         self.config_parser = None
         self.uninstaller = None
+        self.uninstall_jobs = {}
 
+        self._bootstrap_task = None
         self.owned_games_cache = []
-        self.installed_games = self._parse_local_data()
+        self.owned_games = {}
+        self._owned_games_memo = {}
+        self._achievements_store = None
+        self.achievements_metadata = AchievementMetadataCache(METADATA_CACHE_PATH)
+        self.install_progress = {}
+        self.progress_reporter = ProgressReporter(self._publish_install_progress)
+        self.status_notifier = StatusNotifier(self._publish_local_statuses)
+        self.local_state = LocalGamesState()
+        self.local_state.update(self._parse_local_data())
         self.watched_running_games = set()
+        self.game_processes = {}  # blizzard_id -> processes of a watched running game
+        self._background_tasks = set()
+        self._file_watchers = []
 
         self.notifications_enabled = False
-        loop = asyncio.get_event_loop()
-        loop.create_task(self._register_local_data_watcher())
+        self._spawn(self._register_local_data_watcher())
+
+        self.scheduler = Scheduler()
+        for name, func, min_interval, max_interval in (
+            ('owned_games', self._refresh_owned_games, 300, 3600),
+            ('running_games', self._refresh_running_games, 5, 60),
+            ('token_health', self._check_token_health, 60, 240),
+        ):
+            self.scheduler.add_job(name, self.profiler.wrap(f'job:{name}', func), min_interval, max_interval)
 
     async def _register_local_data_watcher(self):
         log.info('Registering local data watcher')
         any_change_event = asyncio.Event()
-        FileWatcher(self.CONFIG_PATH, any_change_event, interval=1)
-        FileWatcher(self.PRODUCT_DB_PATH, any_change_event, interval=2.5)
+        self._file_watchers = [
+            create_file_watcher(self.CONFIG_PATH, any_change_event, interval=1),
+            create_file_watcher(self.PRODUCT_DB_PATH, any_change_event, interval=2.5)
+        ]
         while True:
             await any_change_event.wait()
             log.debug('Change in local data detected. Refreshing')
-            refreshed_games = self._parse_local_data()
-            if not self.notifications_enabled:
-                self._update_statuses(refreshed_games, self.installed_games)
-            self.installed_games = refreshed_games
+            previous = self.local_state.snapshot()
+            refreshed = self.local_state.update(self._parse_local_data())
+            self._report_install_progress()
+            if refreshed is not previous and not self.notifications_enabled:
+                self._update_statuses(refreshed.games, previous.games)
             any_change_event.clear()
 
+    def _spawn(self, coro):
+        """Runs coro in a task referenced until it finishes, so it is neither garbage collected nor lost on shutdown"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
     async def _notify_about_game_stop(self, game, starting_timeout):
         if game.info.blizzard_id in self.watched_running_games:
             log.debug(f'Game {game.info.blizzard_id} is already watched. Skipping')
@@ -92,13 +142,14 @@ class BNetPlugin(Plugin):
         try:
             self.watched_running_games.add(game.info.blizzard_id)
             await asyncio.sleep(starting_timeout)
-            ProcessProvider().update_games_processes([game])
-            log.info(f'Setuping process watcher for {game._processes}')
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, game.wait_until_game_stops)
+            processes = ProcessProvider().find_games_processes([game]).get(game.info.blizzard_id, [])
+            self.game_processes[game.info.blizzard_id] = processes
+            log.info(f'Setuping process watcher for {[process.pid for process in processes]}')
+            await executors.run_in(executors.PROCESS_WAIT, wait_procs, processes)
         finally:
-            self.update_local_game_status(LocalGame(game.info.blizzard_id, LocalGameState.Installed))
+            self.status_notifier.update(game.info.blizzard_id, LocalGameState.Installed)
             self.watched_running_games.remove(game.info.blizzard_id)
+            self.game_processes.pop(game.info.blizzard_id, None)
 
     def _update_statuses(self, refreshed_games, previous_games):
         for blizz_id, refr in refreshed_games.items():
@@ -117,23 +168,73 @@ class BNetPlugin(Plugin):
             elif refr.last_played != prev.last_played:
                 log.debug('Detected launched game')
                 state = LocalGameState.Installed | LocalGameState.Running
-                asyncio.create_task(self._notify_about_game_stop(refr, 5))
+                self._spawn(self._notify_about_game_stop(refr, 5))
             else:
                 continue
 
-            log.info(f'Changing game {blizz_id} state to {state}')
-            self.update_local_game_status(LocalGame(blizz_id, state))
+            self.status_notifier.update(blizz_id, state)
 
         for blizz_id, prev in previous_games.items():
             refr = refreshed_games.get(blizz_id, None)
             if refr is None:
                 log.debug('Detected uninstalled game')
                 state = LocalGameState.None_
-                self.update_local_game_status(LocalGame(blizz_id, state))
+                self.status_notifier.update(blizz_id, state)
+
+    def _publish_local_statuses(self, changes):
+        for game_id, state in changes:
+            log.info(f'Changing game {game_id} state to {state}')
+            self.update_local_game_status(LocalGame(game_id, state))
+
+    @property
+    def achievements_store(self):
+        """Achievements store of the logged in account"""
+        path = os.path.join(ACHIEVEMENTS_STORE_DIR, f'{self.authentication_client.user_details["id"]}.log')
+        if self._achievements_store is None or self._achievements_store.path != path:
+            self._achievements_store = AchievementsStore(path)
+        return self._achievements_store
+
+    @property
+    def installed_games(self):
+        """Installed games of the current local state snapshot"""
+        return self.local_state.snapshot().games
+
+    def _publish_install_progress(self, key, state, progress):
+        log.info(f'Install progress of {key}: {state} {progress:.0%}')
+        self.install_progress[key] = (state, progress)
+
+    def _report_install_progress(self):
+        """Feeds install/update state of every product.db game into the rate-limited progress reporter"""
+        if self.database_parser is None:
+            return
+        blizzard_ids = {}
+        for config_game in self.config_parser.games:
+            try:
+                blizzard_ids[config_game.uninstall_tag] = Blizzard[config_game.uid].blizzard_id
+            except KeyError:
+                continue
+        seen = set()
+        for db_game in self.database_parser.games:
+            if db_game.installed is None:  # state unknown, e.g. reading it from product.db failed
+                continue
+            key = blizzard_ids.get(db_game.uninstall_tag, db_game.ngdp)
+            seen.add(key)
+            if not db_game.installed:
+                state = 'installing'
+            elif not db_game.update_complete:
+                state = 'updating'
+            else:
+                state = 'ready'
+            progress = 1.0 if state == 'ready' else db_game.update_progress
+            self.progress_reporter.update(key, state, progress)
+        for key in self.progress_reporter.keys() - seen:
+            self.progress_reporter.forget(key)
+            self.install_progress.pop(key, None)
 
     def _parse_local_data(self):
         """Game is considered as installed when present in both config and product.db"""
         games = {}
+        current = self.local_state.snapshot().games
 
         try:
             config = load_config(self.CONFIG_PATH)
@@ -162,7 +263,7 @@ class BNetPlugin(Plugin):
 
         try:
             if self.uninstaller is None:
-                if SYSTEM == pf.WINDOWS:
+                if SYSTEM in (pf.WINDOWS, pf.LINUX):
                     uninstaller_path = pathlib.Path(AGENT_PATH) / 'Blizzard Uninstaller.exe'
                     self.uninstaller = Uninstaller(uninstaller_path)
                 elif SYSTEM == pf.MACOS:
@@ -183,13 +284,20 @@ class BNetPlugin(Plugin):
                     except KeyError:
                         log.warning(f'[{config_game.uid}] is not known blizzard game. Skipping')
                         continue
+                    install_path = self.local_client.local_path(db_game.install_path)
+                    previous = current.get(blizzard_game.blizzard_id)
+                    if previous is not None and previous.matches(
+                        config_game.uninstall_tag, db_game.version, config_game.last_played, install_path
+                    ):
+                        games[blizzard_game.blizzard_id] = previous
+                        continue
                     try:
                         games[blizzard_game.blizzard_id] = InstalledGame(
                             blizzard_game,
                             config_game.uninstall_tag,
                             db_game.version,
                             config_game.last_played,
-                            db_game.install_path,
+                            install_path,
                         )
                     except FileNotFoundError as e:
                         log.warning(str(e) + '. Probably outdated product.db after uninstall. Skipping')
@@ -202,15 +310,18 @@ class BNetPlugin(Plugin):
 
     def log_out(self):
         if self.backend_client:
-            asyncio.create_task(self.authentication_client.shutdown())
+            self._spawn(self.authentication_client.shutdown())
+            if self.authentication_client.user_details:
+                self._spawn(self.backend_client.clear_cached_responses(self.authentication_client.user_details.get("id")))
         self.authentication_client.user_details = None
         self.owned_games_cache = []
+        self.owned_games = {}
+        self._achievements_store = None
 
     async def open_battlenet_browser(self):
         url = f"https://www.blizzard.com/apps/battle.net/desktop"
         log.info(f'Opening battle.net website: {url}')
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, lambda x: webbrowser.open(x, autoraise=True), url)
+        await executors.run_in(executors.UI, lambda x: webbrowser.open(x, autoraise=True), url)
 
     async def install_game(self, game_id):
         if not self.authentication_client.is_authenticated():
@@ -234,43 +345,61 @@ class BNetPlugin(Plugin):
             installed_game = self.installed_games.get(game_id, None)
             if installed_game is None or not os.access(installed_game.install_path, os.F_OK):
                 log.error(f'Cannot uninstall {Blizzard[game_id].uid}')
-                self.update_local_game_status(LocalGame(game_id, LocalGameState.None_))
+                self.status_notifier.update(game_id, LocalGameState.None_)
+                return
+
+            if game_id in self.uninstall_jobs:
+                log.info(f'Uninstallation of {game_id} is already in progress')
                 return
 
             uninstall_tag = installed_game.uninstall_tag
             client_lang = self.config_parser.locale_language
-            self.uninstaller.uninstall_game(installed_game, uninstall_tag, client_lang)
-            if SYSTEM == pf.WINDOWS:
+            job = self.uninstaller.uninstall_game(installed_game, uninstall_tag, client_lang)
+            if SYSTEM in (pf.WINDOWS, pf.LINUX):
                 # we're watching config for updates
                 pass
             elif SYSTEM == pf.MACOS:
-                # config info isn't updated but we are sure that we manually cleaned up the game
-                game_state = LocalGameState.None_
-                self.update_local_game_status(LocalGame(game_id, game_state))
+                self.uninstall_jobs[game_id] = job
+                self._spawn(self._run_uninstall_job(game_id, job))
 
         except Exception as e:
             log.exception(f'Uninstalling game {game_id} failed: {e}')
 
+    async def _run_uninstall_job(self, game_id, job):
+        try:
+            await job.run()
+        except asyncio.CancelledError:
+            log.warning(f'Uninstalling game {game_id} cancelled at {job.progress}%')
+        except Exception as e:
+            log.exception(f'Uninstalling game {game_id} failed at {job.progress}%: {e}')
+        else:
+            # config info isn't updated but we are sure that we manually cleaned up the game
+            log.info(f'Uninstalling game {game_id} finished')
+            self.status_notifier.update(game_id, LocalGameState.None_)
+        finally:
+            del self.uninstall_jobs[game_id]
+
     async def launch_game(self, game_id):
         if not self.authentication_client.is_authenticated():
             raise AuthenticationRequired()
 
         try:
-            if self.installed_games is None:
-                raise ClientNotInstalledError(message="B.net client is not called or get_local_games not called")
-
             game = self.installed_games.get(game_id, None)
             if game is None:
                 log.error(f'Launching game that is not installed: {game_id}')
                 return
+            if game_id in self.uninstall_jobs:
+                log.error(f'Launching game that is being uninstalled: {game_id}')
+                return
 
             self.local_client.refresh()
             log.info(f'Launching game of id: {game_id}, {game}')
             await self.local_client.launch_game(game, wait_sec=60)
 
-            self.update_local_game_status(LocalGame(game_id, LocalGameState.Installed | LocalGameState.Running))
+            self.status_notifier.update(game_id, LocalGameState.Installed | LocalGameState.Running)
             self.local_client.close_window()
-            asyncio.create_task(self._notify_about_game_stop(game, 3))
+            self._spawn(self._notify_about_game_stop(game, 3))
+            self.scheduler.poke('running_games')
 
         except ClientNotInstalledError as e:
             log.warning(e)
@@ -288,13 +417,14 @@ class BNetPlugin(Plugin):
                 auth_data = self.authentication_client.process_stored_credentials(stored_credentials)
                 try:
                     await self.authentication_client.create_session()
-                    await self.backend_client.refresh_cookies()
-                    auth_status = await self.backend_client.validate_access_token(auth_data.access_token)
                 except Exception as e:
                     log.exception(f"err: {str(e)}")
                     raise Aborted()
-                if self.authentication_client.validate_auth_status(auth_status):
-                    self.authentication_client.user_details = await self.backend_client.get_user_info()
+                if self.authentication_client.user_details:
+                    # answer from cached user details, validation goes on in the background
+                    self._bootstrap_task = self._spawn(self._validate_stored_session(auth_data, background=True))
+                else:
+                    await self._validate_stored_session(auth_data, background=False)
                 return self.authentication_client.parse_user_details()
             else:
                 log.info(f"Authenticate: running CEF Authenticator")
@@ -305,6 +435,37 @@ class BNetPlugin(Plugin):
             log.exception(f"EX: {str(e)}")
             raise InvalidCredentials()
 
+    async def _validate_stored_session(self, auth_data, background):
+        """Refreshes cookies (unless stored ones are still valid) while validating the access token,
+        then fetches fresh user details
+        """
+        with deadline(self.AUTHENTICATION_TIMEOUT):
+            try:
+                await self.authentication_client.prewarm()
+                calls = [self.backend_client.validate_access_token(auth_data.access_token)]
+                if not self.authentication_client.auth_lifecycle.session_valid():
+                    calls.append(self.backend_client.refresh_cookies())
+                else:
+                    log.debug("Stored session is still valid, skipping cookies refresh")
+                auth_status, *_ = await asyncio.gather(*calls)
+            except Exception as e:
+                log.exception(f"err: {str(e)}")
+                if background:
+                    return
+                raise Aborted()
+            try:
+                if self.authentication_client.validate_auth_status(auth_status):
+                    self.authentication_client.user_details = await self.backend_client.get_user_info()
+            except Aborted:
+                if not background:
+                    raise
+                log.warning("Stored session is not valid anymore")
+                self.lost_authentication()
+            except Exception as e:
+                if not background:
+                    raise
+                log.exception(f"Refreshing user details failed: {str(e)}")
+
     async def pass_login_credentials(self, step, credentials, cookies):
         log.info(f"end uri, {credentials['end_uri']}")
 
@@ -319,18 +480,20 @@ class BNetPlugin(Plugin):
         cookie_jar = self.authentication_client.parse_cookies(cookies)
         auth_data = await self.authentication_client.get_auth_data_login(cookie_jar, credentials)
 
-        try:
-            await self.authentication_client.create_session()
-            await self.backend_client.refresh_cookies()
-        except Exception as e:
-            log.exception(f"err: {str(e)}")
-            raise Aborted()
+        with deadline(self.AUTHENTICATION_TIMEOUT):
+            try:
+                await self.authentication_client.create_session()
+                await self.authentication_client.prewarm()
+                await self.backend_client.refresh_cookies()
+            except Exception as e:
+                log.exception(f"err: {str(e)}")
+                raise Aborted()
 
-        auth_status = await self.backend_client.validate_access_token(auth_data.access_token)
-        if not ("authorities" in auth_status and "IS_AUTHENTICATED_FULLY" in auth_status["authorities"]):
-            raise Aborted()
+            auth_status = await self.backend_client.validate_access_token(auth_data.access_token)
+            if not ("authorities" in auth_status and "IS_AUTHENTICATED_FULLY" in auth_status["authorities"]):
+                raise Aborted()
 
-        self.authentication_client.user_details = await self.backend_client.get_user_info()
+            self.authentication_client.user_details = await self.backend_client.get_user_info()
 
         self.authentication_client.set_credentials()
 
@@ -342,18 +505,12 @@ class BNetPlugin(Plugin):
 
         try:
             if not self.owned_games_cache:
+                await self._wait_for_session_validation()
                 games = await self.backend_client.get_owned_games()
                 self.owned_games_cache = games["gameAccounts"]
+                self.owned_games = self._build_owned_games(self.owned_games_cache)
             log.info(json.dumps(self.owned_games_cache, indent=4))
-            return [
-                Game(
-                    str(game["titleId"]),
-                    game["localizedGameName"],
-                    [],
-                    LicenseInfo(License_Map[game["gameAccountStatus"]]),
-                )
-                for game in self.owned_games_cache
-            ]
+            return list(self.owned_games.values())
         except Exception as e:
             log.exception(f"failed to get owned games: {str(e)}")
             raise
@@ -365,8 +522,9 @@ class BNetPlugin(Plugin):
 
         try:
             local_games = []
-            running_games = ProcessProvider().update_games_processes(self.installed_games.values())
-            for id_, game in self.installed_games.items():
+            installed_games = self.installed_games
+            running_games = ProcessProvider().find_games_processes(installed_games.values()).keys()
+            for id_, game in installed_games.items():
                 if game.playable:
                     state = LocalGameState.Installed
                     if id_ in running_games:
@@ -374,6 +532,7 @@ class BNetPlugin(Plugin):
                 else:
                     state = LocalGameState.None_
                 local_games.append(LocalGame(id_, state))
+                self.status_notifier.reported(id_, state)
 
             return local_games
 
@@ -384,15 +543,51 @@ class BNetPlugin(Plugin):
         finally:
             self.enable_notifications = True
 
+    @property
+    def _achievements_locale(self):
+        if self.config_parser is None:
+            return LOCALE
+        return api_locale(self.config_parser.locale_language)
+
+    async def _refresh_achievements_metadata(self, game):
+        fetchers = {
+            "wow": (self.backend_client.get_wow_achievements_metadata, parse_wow_achievements),
+            "sc2": (self.backend_client.get_sc2_achievements_metadata, parse_sc2_achievements),
+        }
+        get_document, parse = fetchers[game]
+        locale = self._achievements_locale
+
+        async def fetch(etag):
+            document, etag = await get_document(locale, etag)
+            return (None if document is None else parse(document)), etag
+
+        try:
+            await self.achievements_metadata.refresh(game, locale, fetch)
+        except Exception as e:
+            log.warning(f"Refreshing {game} achievement metadata failed, names may be missing: {repr(e)}")
+
+    async def _stored_achievements(self, game):
+        achievements = merge_unlocks(self.achievements_store.characters(game).values())
+        await self._refresh_achievements_metadata(game)
+        names = await self.achievements_metadata.achievement_names(game, self._achievements_locale, achievements)
+        return [
+            Achievement(
+                achievement_id=achievement_id, achievement_name=names.get(achievement_id), unlock_time=unlock_time
+            )
+            for achievement_id, unlock_time in achievements.items()
+        ]
+
     async def _get_wow_achievements(self):
-        achievements = []
+        await self.achievements_store.load()
         try:
             characters_data = await self.backend_client.get_wow_character_data()
             characters_data = characters_data["characters"]
 
             wow_character_data = await asyncio.gather(
                 *[
-                    self.backend_client.get_wow_character_achievements(character["realm"], character["name"])
+                    self.backend_client.get_wow_character_achievements(
+                        character["realm"], character["name"], character.get("lastModified")
+                    )
                     for character in characters_data
                 ],
                 return_exceptions=True,
@@ -402,51 +597,52 @@ class BNetPlugin(Plugin):
                 if isinstance(data, requests.Timeout) or isinstance(data, requests.ConnectionError):
                     raise data
 
-            wow_achievement_data = [
-                list(
-                    zip(
+            for character, data in zip(characters_data, wow_character_data):
+                if type(data) is not dict:
+                    # None means the character has not changed, its unlocks are already stored
+                    continue
+                unlocks = {
+                    achievement_id: int(timestamp / 1000)
+                    for achievement_id, timestamp in zip(
                         data["achievements"]["achievementsCompleted"],
                         data["achievements"]["achievementsCompletedTimestamp"],
                     )
+                }
+                await self.achievements_store.merge(
+                    "wow", f'{character["realm"]}/{character["name"]}', unlocks
                 )
-                for data in wow_character_data
-                if type(data) is dict
-            ]
-
-            already_in = set()
-
-            for char_ach in wow_achievement_data:
-                for ach in char_ach:
-                    if ach[0] not in already_in:
-                        achievements.append(Achievement(achievement_id=ach[0], unlock_time=int(ach[1] / 1000)))
-                        already_in.add(ach[0])
         except (AccessTokenExpired, BackendError) as e:
             log.exception(str(e))
-        with open('wow.json', 'w') as f:
-            f.write(json.dumps(achievements, cls=DataclassJSONEncoder))
-        return achievements
-
-    async def _get_sc2_achievements(self):
-        account_data = await self.backend_client.get_sc2_player_data(self.authentication_client.user_details["id"])
-
-        # TODO what if more sc2 accounts?
-        assert len(account_data) == 1
-        account_data = account_data[0]
-
-        profile_data = await self.backend_client.get_sc2_profile_data(
-                                                         account_data["regionId"], account_data["realmId"],
-                                                         account_data["profileId"]
-                                                         )
+        return await self._stored_achievements("wow")
 
-        sc2_achievement_data = [
-            Achievement(achievement_id=achievement["achievementId"], unlock_time=achievement["completionDate"])
+    async def _get_sc2_profile_achievements(self, profile, semaphore):
+        async with semaphore:
+            profile_data = await self.backend_client.get_sc2_profile_data(
+                profile["regionId"], profile["realmId"], profile["profileId"]
+            )
+        unlocks = {
+            int(achievement["achievementId"]): achievement["completionDate"]
             for achievement in profile_data["earnedAchievements"]
             if achievement["isComplete"]
-        ]
+        }
+        key = f'{profile["regionId"]}/{profile["realmId"]}/{profile["profileId"]}'
+        await self.achievements_store.merge("sc2", key, unlocks)
+
+    async def _get_sc2_achievements(self):
+        await self.achievements_store.load()
+        account_data = await self.backend_client.get_sc2_player_data(self.authentication_client.user_details["id"])
 
-        with open('sc2.json', 'w') as f:
-            f.write(json.dumps(sc2_achievement_data, cls=DataclassJSONEncoder))
-        return sc2_achievement_data
+        semaphore = asyncio.Semaphore(self.SC2_PROFILES_CONCURRENCY)
+        results = await asyncio.gather(
+            *[self._get_sc2_profile_achievements(profile, semaphore) for profile in account_data],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, requests.Timeout) or isinstance(result, requests.ConnectionError):
+                raise result
+            if isinstance(result, Exception):
+                log.error(f"Failed to get sc2 profile achievements: {repr(result)}")
+        return await self._stored_achievements("sc2")
 
     # async def get_unlocked_achievements(self, game_id):
     #     if not self.website_client.is_authenticated():
@@ -466,24 +662,97 @@ class BNetPlugin(Plugin):
     #         log.exception(str(e))
     #         return []
 
-    async def _tick_runner(self):
-        if not self.bnet_client:
-            return
-        try:
-            self.error_state = await self.bnet_client.tick()
-        except Exception as e:
-            self.error_state = True
-            log.exception(f"error state: {str(e)}")
-            raise
+    def _build_owned_games(self, game_accounts):
+        """Maps game accounts to Game objects, reusing the objects built for entries that did not change"""
+        memo = {}
+        games = {}
+        for account in game_accounts:
+            key = (account["titleId"], account["localizedGameName"], account["gameAccountStatus"])
+            game = self._owned_games_memo.get(key)
+            if game is None:
+                game = Game(
+                    str(account["titleId"]),
+                    account["localizedGameName"],
+                    [],
+                    LicenseInfo(License_Map[account["gameAccountStatus"]]),
+                )
+            memo[key] = game
+            games[game.game_id] = game
+        self._owned_games_memo = memo
+        return games
+
+    async def _refresh_owned_games(self):
+        """Pushes only added, removed and changed games to Galaxy"""
+        if not self.authentication_client.is_authenticated() or not self.owned_games_cache:
+            return False
+        games = await self.backend_client.get_owned_games()
+        if games["gameAccounts"] == self.owned_games_cache:
+            return False
+        self.owned_games_cache = games["gameAccounts"]
+        refreshed = self._build_owned_games(self.owned_games_cache)
+
+        changed = False
+        for game_id, game in refreshed.items():
+            previous = self.owned_games.get(game_id)
+            if previous is None:
+                log.info(f'New owned game {game_id}')
+                self.add_game(game)
+                changed = True
+            elif previous is not game and previous != game:
+                log.info(f'Owned game {game_id} changed')
+                self.update_game(game)
+                changed = True
+        for game_id in self.owned_games.keys() - refreshed.keys():
+            log.info(f'Owned game {game_id} removed')
+            self.remove_game(game_id)
+            changed = True
+        self.owned_games = refreshed
+        return changed
+
+    async def _refresh_running_games(self):
+        if not self.local_client.is_installed:
+            return False
+        installed_games = self.installed_games
+        running_games = ProcessProvider().find_games_processes(installed_games.values()).keys()
+        started = running_games - self.watched_running_games
+        for blizz_id in started:
+            log.info(f'Detected running game {blizz_id}')
+            self.status_notifier.update(blizz_id, LocalGameState.Installed | LocalGameState.Running)
+            self._spawn(self._notify_about_game_stop(installed_games[blizz_id], 0))
+        return bool(started)
+
+    async def _wait_for_session_validation(self):
+        """Lets a background validation of the stored session finish first, so no second cookie refresh races it"""
+        if self._bootstrap_task is not None and not self._bootstrap_task.done():
+            await asyncio.shield(self._bootstrap_task)
+
+    async def _check_token_health(self):
+        if not self.authentication_client.is_authenticated():
+            return False
+        await self._wait_for_session_validation()
+        await self.backend_client.ensure_fresh_auth()
+        return False
 
     def tick(self):
-        if not self.error_state and (not self.running_task or self.running_task.done()):
-            self.running_task = asyncio.create_task(self._tick_runner())
-        elif self.error_state:
-            sys.exit(1)
+        self.scheduler.tick()
+        self.profiler.maybe_dump()
 
     def shutdown(self):
         log.info("Plugin shutdown.")
+        log.info(f"Executors: {executors.stats()}")
+        self.profiler.dump()
+        self.scheduler.cancel()
+        self.status_notifier.cancel()
+        for job in self.uninstall_jobs.values():
+            job.cancel()
+        self.achievements_metadata.close()
+        self.backend_client.cancel_revalidations()
+        self.response_cache.close()
+        for watcher in self._file_watchers:
+            watcher.close()
+        for task in self._background_tasks:
+            task.cancel()
+        executors.shutdown()
 
 
 def main():
@@ -1,7 +1,11 @@
 import psutil
-from typing import Set, Iterable
+from typing import Dict, List, Iterable
 
 from game import InstalledGame
+from consts import Platform, SYSTEM
+
+if SYSTEM == Platform.LINUX:
+    import procfs
 
 
 class ProcessProvider(object):
@@ -18,14 +22,28 @@ class ProcessProvider(object):
                 except (psutil.AccessDenied, psutil.NoSuchProcess):
                     pass
 
-    def update_games_processes(self, games: Iterable[InstalledGame]) -> Set[str]:
-        """Matches currently running processes with the game executables and assigns those processes to games
-        :returns     list of currently running games blizzard ids
+    def find_games_processes(self, games: Iterable[InstalledGame]) -> Dict[str, List[psutil.Process]]:
+        """Matches currently running processes with the game executables
+        :returns     dict of currently running games blizzard ids: their processes
         """
-        running_games = set()
+        if SYSTEM == Platform.LINUX:
+            return self._find_games_processes_procfs(games)
+        games_processes = {}
         for proc in psutil.process_iter(attrs=['exe'], ad_value=''):
             for game in games:
-                if proc.info['exe'] in game.execs:
-                    game.add_process(proc)
-                    running_games.add(game.info.blizzard_id)
-        return running_games
+                if game.has_exec(proc.info['exe']):
+                    games_processes.setdefault(game.info.blizzard_id, []).append(proc)
+        return games_processes
+
+    def _find_games_processes_procfs(self, games: Iterable[InstalledGame]) -> Dict[str, List[psutil.Process]]:
+        games_processes = {}
+        games = list(games)
+        for pid, exe in procfs.iter_processes():
+            for game in games:
+                if game.has_exec(exe):
+                    try:
+                        process = psutil.Process(pid)
+                    except psutil.NoSuchProcess:
+                        continue
+                    games_processes.setdefault(game.info.blizzard_id, []).append(process)
+        return games_processes
@@ -0,0 +1,49 @@
+import os
+import logging as log
+
+from consts import WINE_PREFIX
+
+
+PROC_PATH = '/proc'
+WINE_LOADERS = ('wine', 'wine64', 'wine-preloader', 'wine64-preloader')
+
+
+def wine_to_unix_path(path):
+    """Translates windows path of the Wine prefix (C:\\Program Files\\...) to a unix one; unix paths are returned as is"""
+    if len(path) < 2 or path[1] != ':':
+        return path
+    drive = path[0].lower()
+    rest = path[2:].replace('\\', '/').lstrip('/')
+    return os.path.join(WINE_PREFIX, 'dosdevices', f'{drive}:', rest)
+
+
+def _wine_exe(pid):
+    """Wine processes are images of the wine loader; the windows executable is the first cmdline argument"""
+    with open(os.path.join(PROC_PATH, pid, 'cmdline'), 'rb') as f:
+        argv0 = f.read().split(b'\0', 1)[0].decode('utf-8', errors='replace')
+    return wine_to_unix_path(argv0)
+
+
+def process_exe(pid):
+    """:returns  executable of the process, windows image path for Wine processes, or None if not readable"""
+    pid = str(pid)
+    try:
+        exe = os.readlink(os.path.join(PROC_PATH, pid, 'exe'))
+        if os.path.basename(exe) in WINE_LOADERS:
+            return _wine_exe(pid)
+        return exe
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    except OSError as e:
+        log.debug(f'Cannot read executable of process {pid}: {repr(e)}')
+        return None
+
+
+def iter_processes():
+    """Yields (pid, exe) of all readable processes by reading /proc directly"""
+    for entry in os.scandir(PROC_PATH):
+        if not entry.name.isdigit():
+            continue
+        exe = process_exe(entry.name)
+        if exe:
+            yield int(entry.name), exe
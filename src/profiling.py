@@ -0,0 +1,156 @@
+import io
+import os
+import pstats
+import asyncio
+import cProfile
+import functools
+import logging as log
+from time import time, perf_counter
+
+
+PROFILE_ENV = 'BNET_PROFILE'  # "1"/"all" or comma separated names of methods to profile
+PROFILE_TOP_ENV = 'BNET_PROFILE_TOP'
+
+
+class _ProfiledCoroutine(object):
+    """Drives a coroutine step by step with the profiler enabled only while the coroutine itself runs,
+    so time spent in other tasks between its awaits is not attributed to it
+    """
+
+    def __init__(self, coro, profiler, name):
+        self._coro = coro
+        self._profiler = profiler
+        self._name = name
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            enabled = self._profiler._enable(self._name)
+            try:
+                if error is not None:
+                    yielded = self._coro.throw(error)
+                else:
+                    yielded = self._coro.send(value)
+            except StopIteration as e:
+                return e.value
+            finally:
+                if enabled:
+                    self._profiler._disable(self._name)
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                self._coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+class RpcProfiler(object):
+    """Opt-in deterministic profiler of plugin RPC handlers and scheduled jobs.
+    Every profiled name accumulates its own cProfile.Profile across calls. dump() writes one .prof file per
+    name and a summary with call counts, wall times and the top functions of each name.
+    """
+    DUMP_INTERVAL = 600
+
+    def __init__(self, selection, directory, top=30):
+        """:param selection    None/'' to disable, '1', 'all' or '*' for everything, else comma separated names"""
+        self.enabled = bool(selection)
+        self._names = None if selection in ('1', 'all', '*') else {s.strip() for s in (selection or '').split(',')}
+        self.directory = directory
+        self.top = top
+        self._profiles = {}
+        self._timings = {}  # name -> [calls, total wall time, max wall time]
+        self._active = None
+        self._last_dump = time()
+
+    @classmethod
+    def from_environment(cls, default_directory):
+        """Profiles go next to the plugin log file if logging to a file is configured"""
+        directory = default_directory
+        for handler in log.getLogger().handlers:
+            if getattr(handler, 'baseFilename', None):
+                directory = os.path.dirname(handler.baseFilename)
+                break
+        try:
+            top = int(os.environ.get(PROFILE_TOP_ENV, 30))
+        except ValueError:
+            top = 30
+        profiler = cls(os.environ.get(PROFILE_ENV), os.path.join(directory, 'profiles'), top)
+        if profiler.enabled:
+            log.info(f'Profiling {"all methods" if profiler._names is None else profiler._names} '
+                     f'into {profiler.directory}')
+        return profiler
+
+    def wrap(self, name, func):
+        """Returns func unchanged unless name is selected for profiling"""
+        if not self.enabled or (self._names is not None and name not in self._names):
+            return func
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def profiled(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return await _ProfiledCoroutine(func(*args, **kwargs), self, name)
+                finally:
+                    self._record(name, perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def profiled(*args, **kwargs):
+                started = perf_counter()
+                enabled = self._enable(name)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    if enabled:
+                        self._disable(name)
+                    self._record(name, perf_counter() - started)
+        return profiled
+
+    def _enable(self, name):
+        if self._active is not None:  # nested call, accounted to the outer one
+            return False
+        profile = self._profiles.get(name)
+        if profile is None:
+            profile = self._profiles[name] = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiling tool is active
+            return False
+        self._active = name
+        return True
+
+    def _disable(self, name):
+        self._profiles[name].disable()
+        self._active = None
+
+    def _record(self, name, elapsed):
+        timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    def maybe_dump(self):
+        if self.enabled and time() - self._last_dump >= self.DUMP_INTERVAL:
+            self.dump()
+
+    def dump(self):
+        """Writes profiles and summary; has to run on the event loop thread, as the profiles do"""
+        if not self.enabled or self._active is not None:
+            return
+        self._last_dump = time()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            summary = io.StringIO()
+            summary.write(f'{"method":<40}{"calls":>8}{"total s":>12}{"mean s":>12}{"max s":>12}\n')
+            for name, (calls, total, longest) in sorted(self._timings.items(), key=lambda t: -t[1][1]):
+                summary.write(f'{name:<40}{calls:>8}{total:>12.3f}{total / calls:>12.4f}{longest:>12.3f}\n')
+            for name, profile in sorted(self._profiles.items()):
+                file_name = name.replace(':', '-').replace(os.sep, '-')
+                profile.dump_stats(os.path.join(self.directory, f'{file_name}.prof'))
+                summary.write(f'\n===== {name} (wall time spent in executors is not included) =====\n')
+                pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(self.top)
+            with open(os.path.join(self.directory, 'summary.txt'), 'w', encoding='utf-8') as f:
+                f.write(summary.getvalue())
+        except Exception as e:
+            log.exception(f'Writing profiles to {self.directory} failed: {repr(e)}')
@@ -0,0 +1,62 @@
+import asyncio
+import logging as log
+from time import time
+
+
+class ProgressReporter(object):
+    """Publishes progress of many products at a bounded rate.
+    State transitions are published at once; progress changes of a product are published at most once
+    per min_interval, intermediate values are coalesced into the latest one.
+    """
+
+    def __init__(self, publish, min_interval=5.0, min_step=0.01):
+        """:param publish   callable(key, state, progress)"""
+        self._publish = publish
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self._last = {}  # key -> (state, progress, publish time)
+        self._pending = {}  # key -> (state, progress)
+        self._timers = {}
+
+    def update(self, key, state, progress):
+        last = self._last.get(key)
+        if last is None or last[0] != state:
+            self._emit(key, state, progress)
+            return
+        if abs(progress - last[1]) < self.min_step:
+            self._pending.pop(key, None)
+            return
+        wait = last[2] + self.min_interval - time()
+        if wait <= 0:
+            self._emit(key, state, progress)
+            return
+        self._pending[key] = (state, progress)
+        if key not in self._timers:
+            self._timers[key] = asyncio.get_event_loop().call_later(wait, self._flush, key)
+
+    def forget(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._pending.pop(key, None)
+        self._last.pop(key, None)
+
+    def keys(self):
+        return set(self._last)
+
+    def _flush(self, key):
+        self._timers.pop(key, None)
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            self._emit(key, *pending)
+
+    def _emit(self, key, state, progress):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._pending.pop(key, None)
+        self._last[key] = (state, progress, time())
+        try:
+            self._publish(key, state, progress)
+        except Exception as e:
+            log.exception(f'Publishing progress of {key} failed: {repr(e)}')
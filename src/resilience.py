@@ -0,0 +1,112 @@
+import random
+import contextlib
+import contextvars
+import logging as log
+from time import time
+
+
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class Deadline(object):
+    def __init__(self, seconds):
+        self.expires_at = time() + seconds
+
+    def remaining(self):
+        return self.expires_at - time()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Sets time budget for all backend calls made within the block, including tasks spawned from it.
+    A nested deadline never extends the enclosing one.
+    """
+    new_deadline = Deadline(seconds)
+    enclosing = _current_deadline.get()
+    if enclosing is not None and enclosing.expires_at < new_deadline.expires_at:
+        new_deadline = enclosing
+    token = _current_deadline.set(new_deadline)
+    try:
+        yield new_deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+class CircuitBreaker(object):
+    """Stops calling a host after consecutive failures and lets a single probe through after a cool-down"""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def allow(self):
+        if self.state == self.OPEN and time() - self._opened_at >= self.reset_timeout:
+            log.debug(f'Circuit for {self.name} is half-open')
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log.info(f'Circuit for {self.name} closed')
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def abandon(self):
+        """Call was cancelled before its outcome was known"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log.warning(f'Circuit for {self.name} opened after {self._failures} failures')
+            self.state = self.OPEN
+            self._opened_at = time()
+            self._probe_in_flight = False
+
+
+class RetryBudget(object):
+    """Token bucket allowing retries to add at most `ratio` of the regular traffic to a host"""
+
+    def __init__(self, ratio=0.2, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self):
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+def backoff_delay(attempt, base=0.5, cap=5.0):
+    """Exponential backoff with full jitter
+    :param attempt  number of the retry, starting from 0
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
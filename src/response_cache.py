@@ -0,0 +1,187 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import logging as log
+from time import time
+from collections import namedtuple
+
+from executors import run_in, FILESYSTEM
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+
+def new_key():
+    """:returns    new key for encrypting cached responses, None if cryptography is not available"""
+    if Fernet is None:
+        return None
+    return Fernet.generate_key().decode('ascii')
+
+
+def parse_cache_control(header):
+    """:returns    dict of Cache-Control directives; directives without a value map to True"""
+    directives = {}
+    for directive in (header or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') if value else True
+    return directives
+
+
+def _seconds(directives, name, default):
+    try:
+        return max(0, int(directives[name]))
+    except (KeyError, ValueError, TypeError):
+        return default
+
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'stored_at', 'fresh_until', 'stale_until'])
+
+
+class ResponseCache(object):
+    """Disk cache of JSON backend responses, keyed by account and URL.
+
+    Bodies are encrypted with a key that lives in the account's stored credentials, so without cryptography
+    or a key nothing is cached. Freshness follows Cache-Control; a response without max-age is stale at once
+    but may still be served while it is revalidated for the stale window given by the caller, or for
+    DEFAULT_STALE_WHILE_REVALIDATE seconds, which only suits static data.
+    Least recently used entries are evicted once the bodies exceed max_bytes.
+    """
+    DEFAULT_STALE_WHILE_REVALIDATE = 24 * 3600
+
+    def __init__(self, path, max_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._lock = threading.Lock()
+        if Fernet is None:
+            log.warning('cryptography is not available, backend responses will not be cached')
+
+    @property
+    def enabled(self):
+        return Fernet is not None
+
+    def _connect(self):
+        if self._connection is not None:
+            return self._connection
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        with connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY, account TEXT, body BLOB, etag TEXT,
+                    stored_at REAL, fresh_until REAL, stale_until REAL, last_used REAL
+                )
+            ''')
+        self._connection = connection
+        return connection
+
+    def _execute(self, func, *args):
+        with self._lock:
+            try:
+                return func(self._connect(), *args)
+            except sqlite3.Error as e:
+                log.warning(f'Response cache {self.path} failed: {repr(e)}')
+                return None
+
+    @staticmethod
+    def _account(account):
+        return hashlib.sha256(str(account).encode('utf-8')).hexdigest()
+
+    def _key(self, account, url):
+        return hashlib.sha256(f'{account}\n{url}'.encode('utf-8')).hexdigest()
+
+    def _lifetime(self, now, cache_control, stale_window):
+        directives = parse_cache_control(cache_control)
+        max_age = 0 if 'no-cache' in directives else _seconds(directives, 'max-age', 0)
+        if stale_window is None:
+            stale_window = self.DEFAULT_STALE_WHILE_REVALIDATE
+        stale = _seconds(directives, 'stale-while-revalidate', stale_window)
+        return now + max_age, now + max_age + stale
+
+    def _get(self, connection, key, secret):
+        row = connection.execute(
+            'SELECT body, etag, stored_at, fresh_until, stale_until FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        body, etag, stored_at, fresh_until, stale_until = row
+        try:
+            body = json.loads(Fernet(secret.encode('ascii')).decrypt(body))
+        except (InvalidToken, ValueError):
+            log.debug('Dropping cached response encrypted with another key')
+            with connection:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            return None
+        with connection:
+            connection.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time(), key))
+        return CachedResponse(body, etag, stored_at, fresh_until, stale_until)
+
+    def _put(self, connection, key, account, body, secret, etag, cache_control, stale_window):
+        now = time()
+        fresh_until, stale_until = self._lifetime(now, cache_control, stale_window)
+        encrypted = Fernet(secret.encode('ascii')).encrypt(json.dumps(body).encode('utf-8'))
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, account, encrypted, etag, now, fresh_until, stale_until, now)
+            )
+            self._evict(connection)
+
+    def _evict(self, connection):
+        total = connection.execute('SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in connection.execute('SELECT key, LENGTH(body) FROM responses ORDER BY last_used').fetchall():
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _touch(self, connection, key, cache_control, stale_window):
+        fresh_until, stale_until = self._lifetime(time(), cache_control, stale_window)
+        with connection:
+            connection.execute(
+                'UPDATE responses SET fresh_until = ?, stale_until = ?, last_used = ? WHERE key = ?',
+                (fresh_until, stale_until, time(), key)
+            )
+
+    def _clear(self, connection, account):
+        with connection:
+            connection.execute('DELETE FROM responses WHERE account = ?', (account,))
+
+    async def get(self, account, url, secret):
+        """:returns    CachedResponse or None"""
+        if not self.enabled or secret is None:
+            return None
+        return await run_in(FILESYSTEM, self._execute, self._get, self._key(account, url), secret)
+
+    async def put(self, account, url, secret, body, etag=None, cache_control=None, stale_window=None):
+        if not self.enabled or secret is None or 'no-store' in parse_cache_control(cache_control):
+            return
+        await run_in(
+            FILESYSTEM, self._execute, self._put,
+            self._key(account, url), self._account(account), body, secret, etag, cache_control, stale_window
+        )
+
+    async def touch(self, account, url, cache_control=None, stale_window=None):
+        """Renews freshness of an entry the backend reported as not modified"""
+        if not self.enabled:
+            return
+        await run_in(FILESYSTEM, self._execute, self._touch, self._key(account, url), cache_control, stale_window)
+
+    async def clear(self, account):
+        """Removes all responses cached for account"""
+        if not self.enabled:
+            return
+        await run_in(FILESYSTEM, self._execute, self._clear, self._account(account))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
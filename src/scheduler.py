@@ -0,0 +1,71 @@
+import random
+import asyncio
+import logging as log
+from time import time
+
+
+class Job(object):
+    def __init__(self, name, func, min_interval, max_interval, backoff=2.0, jitter=0.1):
+        """
+        :param func         coroutine function returning True when it observed activity (a change)
+        :param backoff      factor the interval grows by after each idle run, up to max_interval
+        :param jitter       relative spread applied to every interval
+        """
+        self.name = name
+        self.func = func
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.interval = min_interval
+        self.next_run = time()
+        self.task = None
+
+    def schedule(self, active):
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        self.next_run = time() + self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+
+class Scheduler(object):
+    """Runs periodic jobs from the plugin tick with adaptive intervals; a job never overlaps with itself"""
+
+    def __init__(self):
+        self._jobs = {}
+
+    def add_job(self, name, func, min_interval, max_interval, **kwargs):
+        self._jobs[name] = Job(name, func, min_interval, max_interval, **kwargs)
+
+    def poke(self, name):
+        """Activity noticed outside of the job: run it soon and at its fastest rate"""
+        job = self._jobs[name]
+        job.interval = job.min_interval
+        job.next_run = min(job.next_run, time())
+
+    def tick(self):
+        now = time()
+        for job in self._jobs.values():
+            if job.running or now < job.next_run:
+                continue
+            job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job):
+        active = False
+        try:
+            active = bool(await job.func())
+        except Exception as e:
+            log.exception(f'Scheduled job {job.name} failed: {repr(e)}')
+        finally:
+            job.schedule(active)
+            log.debug(f'Job {job.name} next run in {job.next_run - time():.1f}s')
+
+    def cancel(self):
+        for job in self._jobs.values():
+            if job.running:
+                job.task.cancel()
@@ -0,0 +1,40 @@
+from types import MappingProxyType
+
+
+class Snapshot(object):
+    """Immutable view of installed games at one version"""
+    __slots__ = ('version', 'games')
+
+    def __init__(self, version, games):
+        self.version = version
+        self.games = MappingProxyType(games)
+
+
+class LocalGamesState(object):
+    """Copy-on-write holder of installed games. Readers take a snapshot and never see it change;
+    refreshes publish a new version that shares all unchanged InstalledGame objects with the previous one.
+    Shared InstalledGame objects are never modified; processes of running games are tracked by the plugin.
+    """
+
+    def __init__(self):
+        self._snapshot = Snapshot(0, {})
+
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def update(self, games):
+        """Publishes freshly parsed games as a new version, unless nothing changed
+        :param games    dict blizzard_id: InstalledGame; objects identical to the current ones count as unchanged
+        :returns        current snapshot
+        """
+        current = self._snapshot.games
+        changed = {blizz_id for blizz_id, game in games.items() if current.get(blizz_id) is not game}
+        changed |= current.keys() - games.keys()
+        if not changed:
+            return self._snapshot
+        self._snapshot = Snapshot(self._snapshot.version + 1, dict(games))
+        return self._snapshot
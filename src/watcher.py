@@ -1,5 +1,9 @@
 import os
+import sys
+import struct
 import asyncio
+import ctypes
+import ctypes.util
 
 import logging as log
 
@@ -12,6 +16,9 @@ class FileWatcher(object):
         self.interval = interval
         self.task = asyncio.create_task(self._watcher())
 
+    def close(self):
+        self.task.cancel()
+
     async def _watcher(self):
         while True:
             try:
@@ -30,3 +37,60 @@ class FileWatcher(object):
                         self.event.set()
             finally:
                 await asyncio.sleep(self.interval)
+
+
+class InotifyWatcher(object):
+    """Sets the event when the file is written, replaced or removed. Watches the parent directory,
+    because Battle.net replaces its files instead of rewriting them in place.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, path, event):
+        self.path = path
+        self.event = event
+        self._name = os.path.basename(path).encode()
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        if self._libc.inotify_add_watch(self._fd, os.path.dirname(path).encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f'inotify_add_watch failed for {path}')
+        asyncio.get_event_loop().add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_length = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+            if name == self._name and not self.event.is_set():
+                self.event.set()
+
+    def close(self):
+        asyncio.get_event_loop().remove_reader(self._fd)
+        os.close(self._fd)
+
+
+def create_file_watcher(path, event, interval):
+    """Inotify watcher on Linux, stat polling everywhere else or if inotify cannot be used"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(path, event)
+        except (OSError, AttributeError) as e:
+            log.warning(f'Inotify unavailable for {path}, polling instead: {repr(e)}')
+    return FileWatcher(path, event, interval)
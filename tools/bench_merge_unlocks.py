@@ -0,0 +1,73 @@
+"""Benchmark of merging achievement unlocks of many characters.
+
+Compares merge_unlocks with the list-of-tuples and set deduplication it replaced (which kept the
+first unlock time seen instead of the earliest). Reports best wall time and tracemalloc peak.
+
+    python tools/bench_merge_unlocks.py --characters 120 --unlocks 20000 --ids 40000
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from achievements import merge_unlocks
+
+
+def dedup_first_seen(characters):
+    """Reduction used before merge_unlocks"""
+    data = [list(zip(unlocks.keys(), unlocks.values())) for unlocks in characters]
+    result = []
+    already_in = set()
+    for char_ach in data:
+        for ach in char_ach:
+            if ach[0] not in already_in:
+                result.append(ach)
+                already_in.add(ach[0])
+    return result
+
+
+def generate(characters, unlocks, ids, seed):
+    rng = random.Random(seed)
+    id_pool = range(1, ids + 1)
+    return [
+        {achievement_id: rng.randint(1262304000, 1577836800) for achievement_id in rng.sample(id_pool, unlocks)}
+        for _ in range(characters)
+    ]
+
+
+def measure(func, data, repeat):
+    best = None
+    for _ in range(repeat):
+        started = perf_counter()
+        func(data)
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--characters', type=int, default=120)
+    parser.add_argument('--unlocks', type=int, default=20000, help='unlocks per character')
+    parser.add_argument('--ids', type=int, default=40000, help='distinct achievement ids')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data = generate(args.characters, min(args.unlocks, args.ids), args.ids, args.seed)
+    print(f'{args.characters} characters x {min(args.unlocks, args.ids)} unlocks over {args.ids} ids')
+    for name, func in (('first seen (old)', dedup_first_seen), ('merge_unlocks', merge_unlocks)):
+        elapsed, peak = measure(func, data, args.repeat)
+        print(f'{name:>18}: {elapsed:.3f}s, peak {peak / 2 ** 20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""Soak harness: drives BNetPlugin through simulated days against local stand-ins and fails
+when traced memory, live asyncio tasks or threads keep growing.
+
+Stand-ins: config and product.db written to a temporary directory (product.db as JSON, read by
+FakeDatabaseParser), short-lived child processes playing running games, and a fake backend.
+The scheduler clock is simulated, everything else runs in real time, so one simulated day takes
+about `1440 * --tick` seconds with the default one-minute step.
+
+    python tools/soak.py --days 7
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import asyncio
+import pathlib
+import argparse
+import tempfile
+import statistics
+import threading
+import subprocess
+import tracemalloc
+import logging as log
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import psutil
+
+import plugin as plugin_module
+import scheduler as scheduler_module
+from definitions import Blizzard, ProductDbInfo
+from plugin import BNetPlugin
+
+
+GAMES = {  # config uid -> (product.db code, uninstall tag)
+    's2': ('s2', 's2_enus'),
+    'wow': ('wow', 'wow_enus'),
+    'prometheus': ('pro', 'prometheus'),
+    'heroes': ('hero', 'heroes'),
+    'hs_beta': ('hsb', 'hs_beta'),
+}
+
+
+class SimulatedClock(object):
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeDatabaseParser(object):
+    """Reads the JSON product.db written by LocalData"""
+    battlenet_present = True
+
+    def __init__(self, data):
+        self.games = [ProductDbInfo(**product) for product in json.loads(data)]
+
+
+class FakeProcesses(object):
+    """Real child processes standing in for running games; blizzard_id -> (Popen, game exe)"""
+    running = {}
+
+    @classmethod
+    def start(cls, game, lifetime):
+        if cls.is_running(game.info.blizzard_id) or not game.execs:
+            return
+        exe = os.path.join(game.install_path, next(iter(game.execs)))
+        child = subprocess.Popen([sys.executable, '-c', f'import time; time.sleep({lifetime})'])
+        cls.running[game.info.blizzard_id] = (child, exe)
+
+    @classmethod
+    def is_running(cls, blizzard_id):
+        entry = cls.running.get(blizzard_id)
+        return entry is not None and entry[0].poll() is None
+
+    @classmethod
+    def reap(cls):
+        for blizzard_id in [b for b in cls.running if not cls.is_running(b)]:
+            del cls.running[blizzard_id]
+
+    @classmethod
+    def kill_all(cls):
+        for child, _ in cls.running.values():
+            child.kill()
+            child.wait()
+        cls.running.clear()
+
+
+class FakeProcessProvider(object):
+    def find_games_processes(self, games):
+        games_processes = {}
+        for game in games:
+            entry = FakeProcesses.running.get(game.info.blizzard_id)
+            if entry is None or entry[0].poll() is not None:
+                continue
+            try:
+                games_processes[game.info.blizzard_id] = [psutil.Process(entry[0].pid)]
+            except psutil.NoSuchProcess:
+                continue
+        return games_processes
+
+
+class FakeLocalClient(object):
+    is_installed = True
+    launch_timings = {}
+
+    def refresh(self):
+        pass
+
+    def local_path(self, path):
+        return path
+
+    async def launch_game(self, game, wait_sec):
+        FakeProcesses.start(game, lifetime=3)
+
+    def close_window(self):
+        pass
+
+
+class FakeUninstaller(object):
+    def __init__(self, *args):
+        pass
+
+    def uninstall_game(self, game, uninstall_tag, lang):
+        pass
+
+
+class FakeSession(object):
+    def close(self):
+        pass
+
+
+class FakeBackend(object):
+    def __init__(self):
+        self.titles = {uid: 'Good' for uid in GAMES}
+
+    def flap(self, rng):
+        uid = rng.choice(list(GAMES))
+        self.titles[uid] = 'Inactive' if self.titles[uid] == 'Good' else 'Good'
+
+    async def get_owned_games(self):
+        return {'gameAccounts': [
+            {'titleId': int(Blizzard[uid].blizzard_id), 'localizedGameName': Blizzard[uid].name,
+             'gameAccountStatus': status}
+            for uid, status in self.titles.items()
+        ]}
+
+    async def ensure_fresh_auth(self):
+        pass
+
+    async def clear_cached_responses(self, account):
+        pass
+
+    def cancel_revalidations(self):
+        pass
+
+
+class NullWriter(object):
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SoakPlugin(BNetPlugin):
+    notifications = Counter()
+
+    def update_local_game_status(self, local_game):
+        self.notifications['update_local_game_status'] += 1
+
+    def add_game(self, game):
+        self.notifications['add_game'] += 1
+
+    def remove_game(self, game_id):
+        self.notifications['remove_game'] += 1
+
+    def update_game(self, game):
+        self.notifications['update_game'] += 1
+
+    def lost_authentication(self):
+        self.notifications['lost_authentication'] += 1
+
+
+class LocalData(object):
+    """Battle.net config and product.db of fake game installs in a temporary directory"""
+
+    def __init__(self, root):
+        self.config_path = os.path.join(root, 'Battle.net.config')
+        self.product_db_path = os.path.join(root, 'product.db')
+        self.last_played = {uid: None for uid in GAMES}
+        self.versions = {uid: '1.0.0' for uid in GAMES}
+        self.install_paths = {}
+        for uid in GAMES:
+            install_path = os.path.join(root, 'games', uid)
+            os.makedirs(os.path.join(install_path, 'bin'))
+            for exe in ('Game.exe', os.path.join('bin', 'Launcher.exe')):
+                exe_path = os.path.join(install_path, exe)
+                with open(exe_path, 'wb') as f:
+                    f.write(b'\0' * 1024)
+                os.chmod(exe_path, 0o755)
+            self.install_paths[uid] = install_path
+        self.write_config()
+        self.write_product_db()
+
+    def write_config(self):
+        games = {uid: {'ServerUid': GAMES[uid][1], 'LastPlayed': self.last_played[uid]} for uid in GAMES}
+        self._write(self.config_path, {'soak': {'Client': {'Language': 'enUS'}}, 'Games': games})
+
+    def write_product_db(self):
+        products = [
+            {'uninstall_tag': tag, 'ngdp': code, 'install_path': self.install_paths[uid],
+             'version': self.versions[uid], 'installed': True, 'playable': self.versions[uid] != '',
+             'update_complete': self.versions[uid] != '', 'update_progress': random.random()}
+            for uid, (code, tag) in GAMES.items()
+        ]
+        products.append({'uninstall_tag': 'battle.net', 'ngdp': 'bna'})
+        self._write(self.product_db_path, products)
+
+    def _write(self, path, content):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)  # Battle.net replaces its files as well
+
+
+class Soak(object):
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.clock = SimulatedClock()
+        self.samples = []
+
+    def install_stand_ins(self, data):
+        scheduler_module.time = self.clock
+        plugin_module.DatabaseParser = FakeDatabaseParser
+        plugin_module.ProcessProvider = FakeProcessProvider
+        plugin_module.LocalClient = FakeLocalClient
+        plugin_module.Uninstaller = FakeUninstaller
+        SoakPlugin.CONFIG_PATH = data.config_path
+        SoakPlugin.PRODUCT_DB_PATH = pathlib.Path(data.product_db_path)
+
+    def log_in(self, plugin):
+        plugin.authentication_client.session = FakeSession()
+        plugin.authentication_client.user_details = {'id': 1, 'battletag': 'soak#1234'}
+
+    async def act(self, plugin, data, backend):
+        """Random user, client and backend activity of one simulated step"""
+        rng = self.rng
+        uid = rng.choice(list(GAMES))
+        game_id = Blizzard[uid].blizzard_id
+        if rng.random() < 0.01:  # game started from Battle.net
+            game = plugin.installed_games.get(game_id)
+            if game is not None:
+                FakeProcesses.start(game, lifetime=rng.uniform(1, 10))
+                data.last_played[uid] = str(int(self.clock.now))
+                data.write_config()
+        if rng.random() < 0.005:
+            await plugin.launch_game(game_id)
+        if rng.random() < 0.02:  # update flapping in product.db
+            data.versions[uid] = '' if data.versions[uid] else '1.0.0'
+            data.write_product_db()
+        if rng.random() < 0.05:
+            await plugin.get_local_games()
+        if rng.random() < 0.01:
+            backend.flap(rng)
+        if rng.random() < 0.002:
+            plugin.log_out()
+            await asyncio.sleep(0)
+            self.log_in(plugin)
+            await plugin.get_owned_games()
+        FakeProcesses.reap()
+
+    def sample(self, plugin):
+        gc.collect()
+        self.samples.append({
+            'memory': tracemalloc.get_traced_memory()[0],
+            'tasks': len(asyncio.all_tasks()),
+            'threads': threading.active_count(),
+            'plugin_tasks': len(plugin._background_tasks),
+            'watched_games': len(plugin.watched_running_games),
+            'game_processes': sum(len(processes) for processes in plugin.game_processes.values()),
+        })
+
+    async def run(self):
+        tracemalloc.start()
+        with tempfile.TemporaryDirectory(prefix='bnet-soak-') as root:
+            data = LocalData(root)
+            self.install_stand_ins(data)
+            plugin = SoakPlugin(None, NullWriter(), 'soak')
+            backend = plugin.backend_client = FakeBackend()
+            self.log_in(plugin)
+            await plugin.get_owned_games()
+
+            steps = int(self.args.days * 24 * 3600 / self.args.step)
+            sample_every = max(1, int(self.args.sample_every * 60 / self.args.step))
+            try:
+                for step in range(steps):
+                    self.clock.advance(self.args.step)
+                    plugin.tick()
+                    await self.act(plugin, data, backend)
+                    await asyncio.sleep(self.args.tick)
+                    if step % sample_every == 0:
+                        self.sample(plugin)
+            finally:
+                plugin.shutdown()
+                FakeProcesses.kill_all()
+                await asyncio.sleep(0.1)
+        tracemalloc.stop()
+        print(f'Notifications sent: {dict(SoakPlugin.notifications)}')
+        return self.report()
+
+    MIN_SAMPLES = 6  # keeps_growing compares thirds of at least two samples each
+
+    def report(self):
+        tolerances = {
+            'memory': self.args.memory_tolerance * 1024,
+            'tasks': 2,
+            'threads': 2,
+            'plugin_tasks': 2,
+            'watched_games': 1,
+            'game_processes': 2,
+        }
+        warmup = int(self.args.warmup / self.args.sample_every)
+        samples = self.samples[warmup:]
+        if len(samples) < self.MIN_SAMPLES:
+            print(f'Soak failed, only {len(samples)} samples left after warm-up, at least {self.MIN_SAMPLES} '
+                  f'are needed; run more --days or sample more often')
+            return False
+        failed = []
+        for metric, tolerance in tolerances.items():
+            values = [sample[metric] for sample in samples]
+            growing = keeps_growing(values, tolerance)
+            status = 'GROWING' if growing else 'ok'
+            print(f'{metric:>15}: first {values[0]:>10}  last {values[-1]:>10}  max {max(values):>10}  {status}')
+            if growing:
+                failed.append(metric)
+        if failed:
+            print(f'Soak failed, still growing after {self.args.days} simulated days: {", ".join(failed)}')
+        return not failed
+
+
+def keeps_growing(values, tolerance):
+    """True if the median rises from each third of the run to the next, by more than tolerance overall"""
+    third = len(values) // 3
+    if third < 2:
+        return False
+    medians = [statistics.median(values[i * third:(i + 1) * third]) for i in range(3)]
+    return medians[0] < medians[1] < medians[2] and medians[2] - medians[0] > tolerance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=float, default=3, help='simulated days to run')
+    parser.add_argument('--step', type=float, default=60, help='simulated seconds per step')
+    parser.add_argument('--tick', type=float, default=0.005, help='real seconds slept per step')
+    parser.add_argument('--sample-every', type=float, default=60, help='simulated minutes between samples')
+    parser.add_argument('--warmup', type=float, default=360, help='simulated minutes excluded from the verdict')
+    parser.add_argument('--memory-tolerance', type=int, default=512, help='allowed memory growth in KiB')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    log.basicConfig(level=log.DEBUG if args.verbose else log.ERROR)
+    ok = asyncio.get_event_loop().run_until_complete(Soak(args).run())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()